@@ -1,9 +1,11 @@
 import os
 import sys
+import hashlib
 import mimetypes
 from pathlib import Path
 from bson.binary import Binary
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 
 # try to import python-magic (libmagic). It's optional.
 try:
@@ -147,6 +149,146 @@ def extract_image_bytes(photo_field):
     # unknown format
     return None, None
 
+def get_photos(doc):
+    """
+    Returns the list of photo fields of a report document (schema-tolerant).
+    """
+    # Many schemas use 'photos' array — adapt as needed.
+    photos = None
+    if "photos" in doc:
+        photos = doc.get("photos")
+    elif "photo" in doc:
+        photos = doc.get("photo")
+    elif "image" in doc:
+        photos = doc.get("image")
+
+    # If field is single Binary or dict, wrap into list
+    if photos is None:
+        # fallback: maybe the image is stored directly at doc['data'] or doc['file']
+        if "data" in doc:
+            photos = [ {"data": doc.get("data"), "contentType": doc.get("contentType", None)} ]
+        else:
+            photos = []
+
+    # Ensure list-like
+    if not isinstance(photos, list):
+        photos = [photos]
+    return photos
+
+
+def save_doc_photos(doc, out_dir, doc_id_str=None):
+    """
+    Writes every photo of doc into out_dir as <doc_id>_<idx><ext>.
+    Returns (saved_paths, content_hash) where content_hash covers all photo bytes.
+    """
+    out_dir = Path(out_dir)
+    doc_id_str = doc_id_str or str(doc.get("_id"))
+    saved = []
+    h = hashlib.sha1()
+
+    for idx, p in enumerate(get_photos(doc), start=1):
+        img_bytes, content_type = extract_image_bytes(p)
+        if img_bytes is None:
+            # try checking inner structure if p is dict-like and contains nested 'data'
+            print(f"[WARN] doc {doc_id_str} photo index {idx}: could not extract bytes, skipping.")
+            continue
+        h.update(img_bytes)
+
+        ext = guess_extension(content_type, img_bytes)
+        filename = f"{doc_id_str}_{idx}{ext}"
+        filepath = out_dir / filename
+
+        try:
+            with open(filepath, "wb") as f:
+                f.write(img_bytes)
+            saved.append(filepath)
+            print(f"[OK] Saved: {filepath} (contentType={content_type})")
+        except Exception as e:
+            print(f"[ERROR] Could not write file {filepath}: {e}")
+    return saved, h.hexdigest()
+
+
+def open_collection(uri=MONGODB_URI, db_name=DB_NAME, coll_name=COLL_NAME):
+    client = MongoClient(uri.strip())
+    return client, client[db_name][coll_name]
+
+
+def list_versions(coll, query=QUERY):
+    """
+    {doc_id: (_id, version)} of every report matching query, without photo bytes.
+    version is updatedAt (ISO string) or, for reports without it, the document's
+    BSON size as "size:<bytes>" (MongoDB 4.4+); None if neither is available.
+    """
+    try:
+        docs = coll.aggregate([
+            {"$match": query},
+            {"$project": {"_id": 1, "updatedAt": 1, "size": {"$bsonSize": "$$ROOT"}}},
+        ])
+    except OperationFailure:
+        # MongoDB < 4.4 has no $bsonSize: reports without updatedAt are hashed after download
+        docs = coll.find(query, {"_id": 1, "updatedAt": 1})
+
+    current = {}
+    for doc in docs:
+        updated = doc.get("updatedAt")
+        if updated is not None:
+            version = updated.isoformat()
+        elif doc.get("size") is not None:
+            version = f"size:{doc['size']}"
+        else:
+            version = None
+        current[str(doc["_id"])] = (doc["_id"], version)
+    return current
+
+
+def fetch_incremental(coll, known_versions, out_dir=OUTPUT_DIR, query=QUERY):
+    """
+    Fetches only reports that are new or changed since the last sync.
+
+    known_versions: {doc_id: version} recorded by the previous sync, where version
+                    is the report's updatedAt (ISO string), its BSON size if it has
+                    no updatedAt, or (old servers) a hash of its photo bytes.
+
+    Returns:
+        changed: {doc_id: (version, [saved image paths])} for new/changed reports
+        removed: set of doc_ids that no longer match query (deleted or resolved)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Cheap pass: ids and versions only, no photo bytes on the wire
+    current = list_versions(coll, query)
+
+    removed = set(known_versions) - set(current)
+    for doc_id in removed:
+        remove_doc_images(out_dir, doc_id)
+
+    to_fetch = [oid for doc_id, (oid, version) in current.items()
+                if version is None or known_versions.get(doc_id) != version]
+
+    changed = {}
+    if to_fetch:
+        for doc in coll.find({"_id": {"$in": to_fetch}}):
+            doc_id = str(doc["_id"])
+            version = current[doc_id][1]
+            remove_doc_images(out_dir, doc_id)
+            saved, content_hash = save_doc_photos(doc, out_dir, doc_id)
+            version = version or content_hash
+            if known_versions.get(doc_id) == version:
+                # No updatedAt and identical photo bytes: nothing to re-embed
+                continue
+            changed[doc_id] = (version, saved)
+    return changed, removed
+
+
+def remove_doc_images(out_dir, doc_id):
+    for p in Path(out_dir).glob(f"{doc_id}_*"):
+        try:
+            p.unlink()
+        except OSError as e:
+            print(f"[WARN] Could not remove {p}: {e}")
+
+
 def main():
     uri = MONGODB_URI.strip()
     if not uri or uri == "YOUR_MONGODB_URI_HERE":
@@ -156,9 +298,7 @@ def main():
     out_dir = Path(OUTPUT_DIR)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    client = MongoClient(uri)
-    db = client[DB_NAME]
-    coll = db[COLL_NAME]
+    client, coll = open_collection(uri)
 
     cursor = coll.find(QUERY)
     total_saved = 0
@@ -167,45 +307,8 @@ def main():
     for doc in cursor:
         total_docs += 1
         doc_id_str = str(doc.get("_id", total_docs))
-        # Many schemas use 'photos' array — adapt as needed.
-        photos = None
-        if "photos" in doc:
-            photos = doc.get("photos")
-        elif "photo" in doc:
-            photos = doc.get("photo")
-        elif "image" in doc:
-            photos = doc.get("image")
-
-        # If field is single Binary or dict, wrap into list
-        if photos is None:
-            # fallback: maybe the image is stored directly at doc['data'] or doc['file']
-            if "data" in doc:
-                photos = [ {"data": doc.get("data"), "contentType": doc.get("contentType", None)} ]
-            else:
-                photos = []
-
-        # Ensure list-like
-        if not isinstance(photos, list):
-            photos = [photos]
-
-        for idx, p in enumerate(photos, start=1):
-            img_bytes, content_type = extract_image_bytes(p)
-            if img_bytes is None:
-                # try checking inner structure if p is dict-like and contains nested 'data'
-                print(f"[WARN] doc {doc_id_str} photo index {idx}: could not extract bytes, skipping.")
-                continue
-
-            ext = guess_extension(content_type, img_bytes)
-            filename = f"{doc_id_str}_{idx}{ext}"
-            filepath = out_dir / filename
-
-            try:
-                with open(filepath, "wb") as f:
-                    f.write(img_bytes)
-                total_saved += 1
-                print(f"[OK] Saved: {filepath} (contentType={content_type})")
-            except Exception as e:
-                print(f"[ERROR] Could not write file {filepath}: {e}")
+        saved, _ = save_doc_photos(doc, out_dir, doc_id_str)
+        total_saved += len(saved)
 
     print("==== Summary ====")
     print(f"Docs scanned: {total_docs}")
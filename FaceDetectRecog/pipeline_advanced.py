@@ -19,15 +19,16 @@ Usage:
 import os
 import sys
 import time
+import json
 import shutil
 import logging
 import argparse
 import threading
-import subprocess
+import multiprocessing
 import cv2
 import torch
 import numpy as np
-from queue import Queue, Empty
+from queue import Empty
 from datetime import datetime
 from pathlib import Path
 
@@ -37,6 +38,11 @@ sys.path.append(os.getcwd())
 # Import existing modules
 try:
     from src.detection.face2 import FaceDetector
+    from src.detection.frame_sampler import AdaptiveSampler
+    from src.pipeline.bounded_queue import BoundedQueue
+    from src.pipeline.batching import collect_batch
+    from src.tracking.deep_sort import Tracker, select_for_embedding
+    from src.tracking.feature_bank import TrackFeatureBank, clip_crop, face_quality
     from src.recognition.face_recog_core import (
         load_model, 
         make_transform, 
@@ -46,6 +52,12 @@ try:
         match_query,
         annotate_and_save
     )
+    from src.recognition.face_recog_core import ReferenceIndex
+    from src.recognition.ann_index import build_ann_index
+    from src.recognition.embedding_store import write_store, has_store
+    from src.recognition.embedding_engine import EmbeddingEngine
+    from src.recognition.face_align import align_faces
+    from src.recognition.quantize import calibration_images, static_cache_path
 except ImportError as e:
     print(f"CRITICAL ERROR: Could not import required modules. Make sure you are in the root directory. {e}")
     sys.exit(1)
@@ -53,30 +65,123 @@ except ImportError as e:
 # ================= Configuration =================
 def parser_args():
     parser = argparse.ArgumentParser(description="Advanced Face Recognition Pipeline")
-    parser.add_argument("--source", type=str, default="0", help="Video source (0 for webcam, or RTSP url)")
+    parser.add_argument("--source", type=str, nargs="+", default=["0"],
+                        help="One or more video sources (0 for webcam, or RTSP urls); one capture thread per source")
+    parser.add_argument("--location", type=str, nargs="*", default=None,
+                        help="Location string per source, in the same order as --source (used in alerts)")
+    parser.add_argument("--det-batch", type=int, default=8, help="Max frames (across cameras) per detection forward pass")
+    parser.add_argument("--det-batch-wait", type=float, default=0.02, help="Max seconds to wait while filling a detection batch")
     parser.add_argument("--conf", type=float, default=0.5, help="Face detection confidence threshold")
+    parser.add_argument("--det-backend", type=str, default="pytorch", choices=["pytorch", "onnx", "openvino"],
+                        help="Face detector runtime; onnx/openvino export once, cache next to the weights and run on CPU")
+    parser.add_argument("--det-threads", type=int, default=None,
+                        help="CPU threads for the onnx/openvino detector (thread mode; process mode uses --torch-threads)")
     parser.add_argument("--threshold", type=float, default=0.5, help="Recognition cosine similarity threshold")
     parser.add_argument("--db-interval", type=int, default=60, help="Seconds between DB updates")
+    parser.add_argument("--queue-size", type=int, default=50, help="Capacity of the crop and embedding queues")
+    parser.add_argument("--frame-queue-size", type=int, default=10, help="Capacity of the frame queue in front of detection")
+    parser.add_argument("--drop-policy", type=str, default="drop-old", choices=["block", "drop-new", "drop-old"],
+                        help="What a full stage queue does: block (1s, then drop), drop the new item, or evict the oldest")
+    parser.add_argument("--sample-interval", type=int, default=10, help="Baseline: send every Nth frame to detection")
+    parser.add_argument("--sample-min-interval", type=int, default=2, help="Detection interval (frames) in active scenes")
+    parser.add_argument("--sample-max-interval", type=int, default=30, help="Detection interval (frames) in static scenes")
+    parser.add_argument("--motion-threshold", type=float, default=4.0, help="Mean abs. thumbnail difference that counts as motion")
+    parser.add_argument("--tracking", type=str, default="on", choices=["on", "off"],
+                        help="on: embed each tracked face on entry, quality improvement or refresh; off: every detection")
+    parser.add_argument("--track-max-age", type=int, default=30, help="Detection updates a lost track is kept alive")
+    parser.add_argument("--track-n-init", type=int, default=3, help="Consecutive detections before a track is confirmed")
+    parser.add_argument("--track-max-iou-distance", type=float, default=0.7, help="Max 1-IoU for a detection to join a track")
+    parser.add_argument("--embed-refresh", type=float, default=10.0, help="Seconds before a tracked face is re-embedded")
+    parser.add_argument("--quality-gain", type=float, default=0.25,
+                        help="Re-embed a track when its face quality improves by this fraction")
+    parser.add_argument("--track-bank-size", type=int, default=5, help="Best-quality embeddings kept per track")
+    parser.add_argument("--track-aggregate", type=str, default="mean", choices=["mean", "best"],
+                        help="Recognize a track by its quality-weighted mean embedding or its best shot")
+    parser.add_argument("--crowd-model", type=str, default=None,
+                        help="CSRNet checkpoint, full or slimmed by src/crowd/slim_checkpoint.py (default: task_two_model_best.pth.tar)")
+    parser.add_argument("--crowd-mode", type=str, default="fp32",
+                        choices=["fp32", "channels_last", "jit", "fp16", "bf16", "onnx"],
+                        help="CSRNet inference mode (see src/crowd/csrnet_runtime.py)")
+    parser.add_argument("--crowd-tile", type=int, default=0,
+                        help="CSRNet tile size in pixels for tiled high-resolution inference (0 = resize frames to 640x360)")
+    parser.add_argument("--crowd-overlap", type=int, default=64, help="Overlap between CSRNet tiles in pixels")
+    parser.add_argument("--crowd-scale", type=float, default=1.0, help="Frame scale before tiling (e.g. 0.5 for 4K)")
+    parser.add_argument("--crowd-zones", type=str, default=None,
+                        help="JSON file of per-camera ROI polygons: {camera_id: {zone: [[x, y], ...]}} in 0..1 coords")
+    parser.add_argument("--crowd-interval", type=int, default=300, help="Seconds between crowd density checks")
+    parser.add_argument("--crowd-change-threshold", type=float, default=0.0,
+                        help="Mean abs. grayscale change a crowd tile needs to be recomputed (0 = always recompute)")
+    parser.add_argument("--crowd-max-staleness", type=float, default=600.0,
+                        help="Max seconds a cached crowd tile density is reused")
+    parser.add_argument("--crowd-store", type=str, default="crowd_store",
+                        help="Directory of the crowd count/density time-series store ('' = disabled)")
+    parser.add_argument("--crowd-map-interval", type=int, default=60,
+                        help="Min seconds between density maps kept in the crowd store")
+    parser.add_argument("--metrics-interval", type=int, default=30, help="Seconds between pipeline metrics log lines")
+    parser.add_argument("--exec-mode", type=str, default="thread", choices=["thread", "process"],
+                        help="thread: all stages in one interpreter; process: detection/embedding in worker processes (CPU boxes)")
+    parser.add_argument("--det-workers", type=int, default=2, help="Detection worker processes (process mode)")
+    parser.add_argument("--torch-threads", type=int, default=1, help="Torch intra-op threads per worker process (process mode)")
+    parser.add_argument("--frame-slots", type=int, default=8,
+                        help="Shared-memory frame slots, split across detection workers (process mode)")
+    parser.add_argument("--max-frame-size", type=int, nargs=2, default=[1920, 1080],
+                        help="Largest frame W H a slot holds; bigger frames are downscaled (process mode)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Max face crops per embedding forward pass")
+    parser.add_argument("--batch-wait-time", type=float, default=0.01, help="Max seconds to wait while filling an embedding batch")
+    parser.add_argument("--embed-runtime", type=str, default="eager", choices=["eager", "onnx", "torchscript"],
+                        help="Embedder runtime; onnx/torchscript are exported once into exported_models/")
+    parser.add_argument("--embed-quantize", type=str, default="none", choices=["none", "dynamic", "static"],
+                        help="INT8 embedder on CPU: dynamic (linear layers) or static (convs, calibrated on exported_images)")
+    parser.add_argument("--align", type=str, default="on", choices=["on", "off"],
+                        help="Warp faces to 160x160 from their 5 landmarks (on), or crop + resize the box (off)")
+    parser.add_argument("--temp-storage", type=str, default="memory", choices=["memory", "disk"],
+                        help="Keep crops/embeddings in memory, or also write them to temp_crops/temp_embeddings")
+    parser.add_argument("--evidence", type=str, default="matches", choices=["off", "matches", "all"],
+                        help="Persist crops of confirmed matches (matches) and near-misses (all)")
+    parser.add_argument("--evidence-dir", type=str, default="evidence", help="Directory for persisted evidence crops")
+    parser.add_argument("--evidence-max-files", type=int, default=5000, help="Retention: max evidence crops kept")
+    parser.add_argument("--evidence-max-age", type=float, default=7, help="Retention: max age of evidence crops in days")
+    parser.add_argument("--index-backend", type=str, default="exact", choices=["exact", "ivf", "faiss"],
+                        help="Reference search backend: exact brute force, or approximate (ivf / faiss HNSW)")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists scanned per query (higher = better recall, slower)")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW search breadth for the faiss backend")
     return parser.parse_args()
 
 args = parser_args()
 
-VIDEO_SOURCE = int(args.source) if args.source.isdigit() else args.source
+VIDEO_SOURCES = [int(src) if src.isdigit() else src for src in args.source]
 CONF_THRESH = args.conf
 RECOGNITION_THRESHOLD = args.threshold
 CHECK_DB_INTERVAL = args.db_interval
+INDEX_BACKEND = args.index_backend
+TEMP_STORAGE = args.temp_storage
+DROP_POLICY = args.drop_policy
+EXEC_MODE = args.exec_mode
+TRACKING = args.tracking == "on"
+ALIGN = args.align == "on"
+EMBED_QUANTIZE = None if args.embed_quantize == "none" else args.embed_quantize
+# Recorded with the reference store: embeddings from different preprocessing don't mix
+PREPROCESS = "aligned160" if ALIGN else "crop160"
+FACE_SIZE = 160
+CROP_SLOTS = 64
+CROP_SLOT_BYTES = 256 * 256 * 3
 
 # Directories
 DIRS = {
     "crops": "temp_crops",
     "embeddings": "temp_embeddings",
+    "evidence": args.evidence_dir,
     "exported_images": "exported_images",
     "reference_embeddings": "reference_embeddings",
     "logs": "logs"
 }
+SYNC_STATE_FILE = "sync_state.json"
 
 # ================= Logger =================
 def setup_logger():
+    if multiprocessing.parent_process() is not None:
+        # Spawned worker re-importing this script: no extra log file
+        return logging.getLogger("Pipeline")
     os.makedirs(DIRS["logs"], exist_ok=True)
     log_file = os.path.join(DIRS["logs"], f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
     
@@ -96,6 +201,7 @@ logger = setup_logger()
 def cleanup_temp_dirs():
     """Clear cropped images, embeddings, and other temporary files."""
     logger.info("Cleaning up temporary directories...")
+    # In memory mode the temp dirs are only cleared (left over from disk runs), never refilled
     for key in ["crops", "embeddings"]:
         path = DIRS[key]
         if os.path.exists(path):
@@ -127,35 +233,116 @@ def get_device_location():
     #     logger.warning(f"Failed to fetch location: {e}")
     #     return "Unknown Location"
 
+class Camera:
+    """One video source: its attribution (id, location) and latest frame for the crowd monitor."""
+    def __init__(self, camera_id, source, location):
+        self.camera_id = camera_id
+        self.source = source
+        self.location = location
+        self.latest_frame = None
+        self.latest_frame_lock = threading.Lock()
+        self.sampler = AdaptiveSampler(
+            base_interval=args.sample_interval,
+            min_interval=args.sample_min_interval,
+            max_interval=args.sample_max_interval,
+            motion_thresh=args.motion_threshold
+        )
+        self.tracker = make_tracker()
+
+
+def make_tracker():
+    if not TRACKING:
+        return None
+    return Tracker(max_age=args.track_max_age, n_init=args.track_n_init,
+                   max_iou_distance=args.track_max_iou_distance)
+
+
+def faces_to_embed(tracker, detections, det_array, frame, now, qualities=None):
+    """
+    [(det_index, track_id), ...] of detections that need an embedding.
+    det_array: the same detections as an (N, 15) array (fed to the tracker).
+    Without a tracker every detection is embedded (track_id None).
+    """
+    if tracker is None:
+        return [(i, None) for i in range(len(detections))]
+    tracks = tracker.update(det_array, frame)
+    return select_for_embedding(tracks, detections, now, args.embed_refresh, args.quality_gain, qualities)
+
+
+def build_cameras():
+    locations = args.location or []
+    cameras = []
+    for i, src in enumerate(VIDEO_SOURCES):
+        if i < len(locations):
+            location = locations[i]
+        elif len(VIDEO_SOURCES) == 1:
+            location = get_device_location()
+        else:
+            location = f"Camera {i + 1}"
+        cameras.append(Camera(i, src, location))
+    return cameras
+
+
 class Pipeline:
     def __init__(self):
         self.running = True
-        self.frame_queue = Queue(maxsize=10)     # Frames to process
-        self.crop_queue = Queue(maxsize=50)      # Crops to embed
-        self.embed_queue = Queue(maxsize=50)     # Embeddings to recognize
+        # Bounded stage queues: full queues drop per --drop-policy instead of stalling upstream
+        self.frame_queue = BoundedQueue(args.frame_queue_size, DROP_POLICY, "frames", block_timeout=1)  # Frames to process
+        self.crop_queue = BoundedQueue(args.queue_size, DROP_POLICY, "crops", block_timeout=1)          # Crops to embed
+        self.embed_queue = BoundedQueue(args.queue_size, DROP_POLICY, "embeddings", block_timeout=1)    # Embeddings to recognize
         
         # Models
         self.detector = None
         self.recog_model = None
         self.recog_device = None
         self.recog_transform = None
+        self.embedder = None
         
         # Reference Data
-        self.reference_index = []
+        self.reference_index = None  # ReferenceIndex, built by load_embeddings_index
         self.reference_lock = threading.Lock()
+        self.reference_client = None
+        self.reference_collection = None
+
+        # Per-track top-K embeddings; recognition runs on the aggregate
+        self.feature_bank = TrackFeatureBank(args.track_bank_size, args.track_aggregate) if TRACKING else None
+        self.crowd_gate = None  # ChangeGate of the crowd monitor (set by thread_crowd)
         
         # Alert Manager
         MONGO_URI = "YOUR MongoDB-URI"
         from src.alerts.alert_manager import AlertManager
         self.alert_manager = AlertManager(mongo_uri=MONGO_URI, cooldown_seconds=300)
         
-        # Location
-        self.location = get_device_location()
-        logger.info(f"Device Location set to: {self.location}")
+        # Cameras (one capture thread each; models and later stages are shared)
+        self.cameras = build_cameras()
+        for cam in self.cameras:
+            logger.info(f"Camera {cam.camera_id}: {cam.source} -> Location: {cam.location}")
+
+        # Evidence crops (matches / near-misses), written off the hot path
+        self.evidence_writer = None
+        if args.evidence != "off":
+            from src.alerts.evidence_writer import EvidenceWriter
+            self.evidence_writer = EvidenceWriter(
+                root=DIRS["evidence"],
+                kinds=("match", "near_miss") if args.evidence == "all" else ("match",),
+                max_files=args.evidence_max_files,
+                max_age_days=args.evidence_max_age
+            )
         
-        # Shared frame for crowd monitor
-        self.latest_frame = None
-        self.latest_frame_lock = threading.Lock()
+        # Process mode: shared-memory rings to detection/embedding worker processes
+        self.workers = []
+        if EXEC_MODE == "process":
+            from src.pipeline.shm_ring import ShmRing
+            self.mp_ctx = multiprocessing.get_context("spawn")
+            max_w, max_h = args.max_frame_size
+            # One frame ring per detection worker; a camera always maps to the same
+            # worker so its tracker sees every sampled frame in order
+            slots = max(2, args.frame_slots // args.det_workers)
+            self.frame_rings = [ShmRing(self.mp_ctx, slots, max_w * max_h * 3) for _ in range(args.det_workers)]
+            self.crop_ring = ShmRing(self.mp_ctx, CROP_SLOTS, CROP_SLOT_BYTES)
+            # Embeddings (at most one per crop slot) plus headroom for the detection workers' face counts
+            self.result_queue = self.mp_ctx.Queue(maxsize=CROP_SLOTS + 4 * args.det_workers)
+            self.stop_event = self.mp_ctx.Event()
 
         # Initialize
         cleanup_temp_dirs()
@@ -166,274 +353,381 @@ class Pipeline:
     def init_models(self):
         logger.info("Initializing models...")
         # Detector
-        # Note: FaceDetector internally might use CUDA.
-        self.detector = FaceDetector(conf_thresh=CONF_THRESH)
+        # Note: FaceDetector internally might use CUDA (pytorch backend).
+        # Built before any detection worker starts, so an onnx/openvino export happens once, here.
+        self.detector = FaceDetector(conf_thresh=CONF_THRESH, backend=args.det_backend, cpu_threads=args.det_threads)
         
         # Recognition
-        self.recog_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.recog_model = load_model(device=self.recog_device)
+        # Quantized models only run on the CPU
+        use_cuda = torch.cuda.is_available() and EMBED_QUANTIZE is None
+        self.recog_device = torch.device('cuda' if use_cuda else 'cpu')
+        # Static INT8 is calibrated (or loaded from the cache) here, before the reference sync
+        # embeds anything; the embedding worker gets this exact state file, never recalibrates
+        calib_images = calibration_images(DIRS["exported_images"])
+        self.recog_model = load_model(device=self.recog_device, runtime=args.embed_runtime, quantize=EMBED_QUANTIZE,
+                                      calib_dir=calib_images, calib_detector=self.detector,
+                                      calib_align=ALIGN)
+        self.quant_state = None
+        if EMBED_QUANTIZE == "static" and calib_images:
+            state = static_cache_path(calib_images, align=ALIGN)
+            self.quant_state = str(state) if state.exists() else None
         self.recog_transform = make_transform()
+        self.embedder = EmbeddingEngine(
+            self.recog_model,
+            self.recog_device,
+            max_batch=args.batch_size,
+            max_wait=args.batch_wait_time
+        )
         logger.info(f"Models initialized. Recognition device: {self.recog_device}")
 
     def update_reference_db(self):
         """
-        1. Clean old data (exported_images, reference_embeddings).
-        2. Fetch images from MongoDB (using fetch_image_db.py).
-        3. Detect faces in fetched images and crop them.
-        4. Compute embeddings for crops.
-        5. Save and index.
+        Incremental sync of the reference database:
+        1. Ask MongoDB which reports are new/changed (by _id + updatedAt or photo hash)
+           and which were removed or resolved since the last sync.
+        2. Fetch, detect, crop and embed only the changed photos.
+        3. Merge them into the live index (dropping stale rows) and persist
+           the packed store plus the sync state.
         """
-        logger.info("Updating reference database...")
-        
-        # 1. Cleanup
+        logger.info("Syncing reference database...")
+        embeddings_dir = Path(DIRS["reference_embeddings"])
+        embeddings_dir.mkdir(parents=True, exist_ok=True)
+
+        # Load what is already on disk (e.g. after a restart) before syncing
+        if self.reference_index is None and has_store(embeddings_dir):
+            self.reload_reference_index()
+        known_versions = self.load_sync_state() if self.reference_index is not None else {}
+
+        # 1. Fetch changes
         try:
-            for d in [DIRS["exported_images"], DIRS["reference_embeddings"]]:
-                if os.path.exists(d):
-                    logger.info(f"Clearing old data in {d}...")
-                    for filename in os.listdir(d):
-                        file_path = os.path.join(d, filename)
-                        try:
-                            if os.path.isfile(file_path) or os.path.islink(file_path):
-                                os.unlink(file_path)
-                            elif os.path.isdir(file_path):
-                                shutil.rmtree(file_path)
-                        except Exception as e:
-                            logger.error(f"Failed to delete {file_path}. Reason: {e}")
+            from lost_images import fetch_image_db
+            if self.reference_collection is None:
+                self.reference_client, self.reference_collection = fetch_image_db.open_collection()
+            changed, removed = fetch_image_db.fetch_incremental(
+                self.reference_collection, known_versions, out_dir=DIRS["exported_images"]
+            )
         except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
-
-        # 2. Fetch
-        fetch_script = os.path.join("lost_images", "fetch_image_db.py")
-        if os.path.exists(fetch_script):
+            logger.error(f"Failed to fetch reference reports: {e}")
+            self.reference_collection = None
+            return
+
+        if not changed and not removed:
+            logger.info("Reference database up to date.")
+            return
+        logger.info(f"Reference sync: {len(changed)} new/changed reports, {len(removed)} removed.")
+
+        # 2. Detect -> Crop -> Embed only the changed photos
+        new_ids = []
+        new_embs = []
+        for doc_id, (_, paths) in changed.items():
+            for p in paths:
+                try:
+                    emb = self.embed_reference_image(p)
+                    if emb is None:
+                        continue
+                    new_ids.append(str(p.name))
+                    new_embs.append(emb)
+                except Exception as e:
+                    logger.error(f"Error processing reference image {p}: {e}")
+
+        # 3. Merge into the live index; rows of changed/removed reports are replaced
+        stale_docs = set(removed) | set(changed)
+        # Without a sync state the store cannot be trusted: rebuild from this fetch
+        base = self.reference_index if known_versions and self.reference_index is not None else ReferenceIndex([], [])
+        drop_ids = [i for i in base.ids if i.split('_')[0] in stale_docs]
+        merged = base.merge(np.asarray(new_embs, dtype=np.float32), new_ids, drop_ids)
+
+        write_store(embeddings_dir, merged.matrix, merged.ids)
+        ann_path = embeddings_dir / f"ann_{INDEX_BACKEND}.npz"
+        if INDEX_BACKEND != "exact" and type(merged) is ReferenceIndex and len(merged):
+            # Full rebuild: build the configured ANN backend over the new store (and cache it)
             try:
-                logger.debug("Running fetch_image_db.py...")
-                subprocess.run([sys.executable, fetch_script], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                merged = build_ann_index(merged.matrix, merged.ids, backend=INDEX_BACKEND, cache_path=ann_path,
+                                         nprobe=args.nprobe, ef_search=args.ef_search, normalized=True)
             except Exception as e:
-                logger.error(f"Failed to run fetch_image_db.py: {e}")
-        
-        # 3. Smart Precompute (Detect -> Crop -> Embed)
-        logger.info("Processing reference images (Detect -> Crop -> Embed)...")
-        
-        embeddings_dir = Path(DIRS["reference_embeddings"])
-        embeddings_dir.mkdir(parents=True, exist_ok=True)
-        dataset_dir = Path(DIRS["exported_images"])
-        
-        index_csv = embeddings_dir / 'embeddings_index.csv'
-        rows = []
-        
-        # Import needed for smart processing
-        from src.recognition.face_recog_core import read_image, get_embedding_pytorch
-        from PIL import Image
-        
-        image_paths = sorted([p for p in dataset_dir.iterdir() if p.is_file() and p.suffix.lower() in ['.jpg', '.jpeg', '.png']])
-        
-        # Use a temporary list to avoid updating index while reading
-        new_rows = []
-        count_processed = 0
-        
-        for p in image_paths:
+                logger.warning(f"Could not build {INDEX_BACKEND} index, using exact search: {e}")
+        elif hasattr(merged, "save"):
             try:
-                # We need BGR for detection, but read_image returns PIL RGB
-                # Let's read with cv2 for detection first
-                img_bgr = cv2.imread(str(p))
-                if img_bgr is None:
-                    continue
-                    
-                # Detect
-                detections = self.detector.detect(img_bgr)
-                
-                # If faces found, pick the largest/most confident
-                face_crop = None
-                
-                if len(detections) > 0:
-                    # Sort by confidence (index 4)
-                    detections.sort(key=lambda x: x[4], reverse=True)
-                    x1, y1, x2, y2, conf, _ = detections[0]
-                    
-                    h, w = img_bgr.shape[:2]
-                    x1, y1 = max(0, x1), max(0, y1)
-                    x2, y2 = min(w, x2), min(h, y2)
-                    
-                    if x2 > x1 and y2 > y1:
-                        face_crop = img_bgr[y1:y2, x1:x2]
-                        # logger.debug(f"Face detected in {p.name}")
-                else:
-                    logger.warning(f"No face detected in reference image {p.name}. Skipping.")
-                    continue
-                
-                if face_crop is None:
-                    continue
-
-                # Convert crop to PIL for embedding
-                img_rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
-                img_pil = Image.fromarray(img_rgb)
-                
-                # Embed
-                emb = get_embedding_pytorch(img_pil, self.recog_model, self.recog_device, self.recog_transform)
-                if emb is None:
-                    continue
-                    
-                emb_file = embeddings_dir / (p.stem + '.npy')
-                np.save(str(emb_file), emb)
-                new_rows.append([str(p.name), str(emb_file.name)])
-                count_processed += 1
-                
+                merged.save(ann_path)
             except Exception as e:
-                logger.error(f"Error processing reference image {p}: {e}")
-
-        # Save index
-        import csv
-        with open(index_csv, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['image_file', 'embedding_file'])
-            writer.writerows(new_rows)
-            
-        logger.info(f"Ref DB Update Complete. Processed {count_processed} identities.")
+                logger.warning(f"Could not persist ANN index: {e}")
+
+        for doc_id in removed:
+            known_versions.pop(doc_id, None)
+        for doc_id, (version, _) in changed.items():
+            known_versions[doc_id] = version
+        self.save_sync_state(known_versions)
 
-        # 3. Reload Index
+        with self.reference_lock:
+            self.reference_index = merged
+        logger.info(f"Ref DB Update Complete. Embedded {len(new_ids)} photos, dropped {len(drop_ids)}; "
+                    f"{len(merged)} reference identities loaded.")
+
+    def embed_reference_image(self, path):
+        """Detects the most confident face in a reference photo and embeds it."""
+        img_bgr = cv2.imread(str(path))
+        if img_bgr is None:
+            return None
+
+        detections = self.detector.detect(img_bgr)
+        if len(detections) == 0:
+            logger.warning(f"No face detected in reference image {Path(path).name}. Skipping.")
+            return None
+
+        # Sort by confidence (index 4)
+        detections.sort(key=lambda x: x[4], reverse=True)
+        face_crop = clip_crop(img_bgr, detections[0])
+        if face_crop is None:
+            return None
+        if ALIGN:
+            face_crop = align_faces(img_bgr, detections[:1], FACE_SIZE)[0]
+
+        # Same preprocessing as live crops so reference and query embeddings match
+        return self.embedder.embed([face_crop])[0]
+
+    def reload_reference_index(self):
         with self.reference_lock:
             try:
-                self.reference_index = load_embeddings_index(DIRS["reference_embeddings"])
+                self.reference_index = load_embeddings_index(
+                    DIRS["reference_embeddings"],
+                    backend=INDEX_BACKEND,
+                    nprobe=args.nprobe,
+                    ef_search=args.ef_search
+                )
                 logger.info(f"Loaded {len(self.reference_index)} reference identities.")
             except Exception as e:
                 logger.error(f"Error loading reference index: {e}")
 
+    def load_sync_state(self):
+        # {doc_id: version} of reports already embedded in the packed store
+        path = Path(DIRS["reference_embeddings"]) / SYNC_STATE_FILE
+        if not path.exists():
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read sync state ({e}); doing a full resync.")
+            return {}
+        if state.pop("__preprocess__", None) != PREPROCESS:
+            logger.info(f"Reference store was built with different preprocessing; re-embedding with {PREPROCESS}.")
+            return {}
+        return state
+
+    def save_sync_state(self, versions):
+        path = Path(DIRS["reference_embeddings"]) / SYNC_STATE_FILE
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**versions, "__preprocess__": PREPROCESS}, f)
+        os.replace(tmp, path)
+
     # ================= Threads =================
     
-    def thread_capture(self):
-        """Captures frames from video source."""
-        logger.info(f"Starting Capture Thread. Source: {VIDEO_SOURCE}")
-        cap = cv2.VideoCapture(VIDEO_SOURCE)
+    def thread_capture(self, cam):
+        """Captures frames from one camera's video source."""
+        logger.info(f"Starting Capture Thread. Camera {cam.camera_id} Source: {cam.source}")
+        cap = cv2.VideoCapture(cam.source)
         
         frame_count = 0
         while self.running:
             ret, frame = cap.read()
             if not ret:
-                logger.warning("Failed to read frame or end of stream. Retrying...")
+                logger.warning(f"Camera {cam.camera_id}: Failed to read frame or end of stream. Retrying...")
                 time.sleep(1)
                 # simple reconnect logic could go here
                 cap.release()
-                cap = cv2.VideoCapture(VIDEO_SOURCE)
+                cap = cv2.VideoCapture(cam.source)
                 continue
             
             frame_count += 1
             
             # Update latest frame shared variable
-            with self.latest_frame_lock:
-                 self.latest_frame = frame.copy()
+            with cam.latest_frame_lock:
+                 cam.latest_frame = frame
             
-            # Process every 10th frame
-            if frame_count % 10 == 0:
-                try:
-                    # Put frame in queue (blocking if full to avoid memory overflow)
-                    self.frame_queue.put((frame_count, frame.copy()), timeout=1)
-                except:
-                   pass # Drop frame if full
-            
-            # (Optional) Display feed logic can go here or in main thread
-            # For this pipeline, we might just show it in the main loop or not at all.
-            # Let's assume UI is handled separately or we just log.
+            # Adaptive sampling: more often with motion/faces, less on static scenes or backlog
+            if cam.sampler.should_detect(frame, self.detection_backlog(cam.camera_id)):
+                self.submit_frame(cam.camera_id, frame_count, frame)
             
         cap.release()
-        logger.info("Capture Thread stopped.")
+        logger.info(f"Capture Thread for camera {cam.camera_id} stopped.")
+
+    def frame_ring_for(self, camera_id):
+        return self.frame_rings[camera_id % len(self.frame_rings)]
+
+    def detection_backlog(self, camera_id):
+        """Fill ratio (0..1) of the frame buffer in front of detection."""
+        try:
+            if EXEC_MODE == "process":
+                ring = self.frame_ring_for(camera_id)
+                return 1.0 - ring.free.qsize() / ring.n_slots
+            return self.frame_queue.qsize() / self.frame_queue.maxsize
+        except NotImplementedError:
+            return 0.0  # qsize() is unavailable on macOS
+
+    def submit_frame(self, camera_id, frame_id, frame):
+        """Hands a frame to detection: in-process queue or shared-memory ring."""
+        if EXEC_MODE == "process":
+            from src.pipeline.process_stages import fit_to_slot
+            ring = self.frame_ring_for(camera_id)
+            frame = fit_to_slot(frame, ring.slot_bytes)
+            ring.put(frame, (camera_id, frame_id),
+                                timeout=1 if DROP_POLICY == "block" else None,
+                                evict_oldest=DROP_POLICY == "drop-old")
+            return
+        self.frame_queue.put((camera_id, frame_id, frame))
+
+    def thread_worker_results(self):
+        """
+        Process mode: moves embeddings from the worker processes into embed_queue,
+        copying each (small) crop out of shared memory and freeing its slot, and
+        feeds the detection workers' per-frame face/track counts to the samplers.
+        """
+        logger.info("Starting Worker Results Thread.")
+        while self.running:
+            try:
+                msg = self.result_queue.get(timeout=1)
+            except Empty:
+                continue
+            if msg[0] == "faces":
+                for camera_id, n_faces, n_tracks in msg[1]:
+                    self.cameras[camera_id].sampler.note_faces(n_faces, n_tracks)
+                continue
+            _, emb, slot, shape, crop_id, camera_id, frame_id, track_id, quality = msg
+            face_crop = self.crop_ring.view(slot, shape).copy()
+            self.crop_ring.release(slot)
+            if TEMP_STORAGE == "disk":
+                cv2.imwrite(os.path.join(DIRS["crops"], crop_id + ".jpg"), face_crop)
+                np.save(os.path.join(DIRS["embeddings"], crop_id + ".npy"), emb)
+            self.embed_queue.put((emb, crop_id, face_crop, camera_id, frame_id, track_id, quality))
+
+    def start_workers(self):
+        from src.pipeline.process_stages import detection_worker, embedding_worker
+        tracking = None
+        if TRACKING:
+            tracking = {
+                "max_age": args.track_max_age, "n_init": args.track_n_init,
+                "max_iou_distance": args.track_max_iou_distance,
+                "refresh_interval": args.embed_refresh, "quality_gain": args.quality_gain,
+            }
+        for i, frame_ring in enumerate(self.frame_rings):
+            self.workers.append(self.mp_ctx.Process(
+                target=detection_worker,
+                args=(frame_ring, self.crop_ring, self.result_queue, self.stop_event, CONF_THRESH,
+                      args.det_batch, args.det_batch_wait, args.torch_threads, tracking, ALIGN,
+                      self.detector.backend),
+                name=f"DetectionWorker-{i}", daemon=True
+            ))
+        self.workers.append(self.mp_ctx.Process(
+            target=embedding_worker,
+            args=(self.crop_ring, self.result_queue, self.stop_event, args.batch_size,
+                  args.batch_wait_time, 160, 'vggface2', args.torch_threads, args.embed_runtime,
+                  EMBED_QUANTIZE, self.quant_state),
+            name="EmbeddingWorker", daemon=True
+        ))
+        for p in self.workers:
+            p.start()
+        logger.info(f"Started {len(self.workers)} worker processes.")
+
+    def stop_workers(self):
+        self.stop_event.set()
+        for p in self.workers:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        for ring in self.frame_rings:
+            ring.close()
+        self.crop_ring.close()
 
     def thread_detection(self):
         """
-        Consumes frames.
-        Detects faces.
-        Crops and saves.
+        Consumes frames from all cameras in batches.
+        Detects faces with one forward pass per batch.
+        Tracks faces per camera; crops only those due for an embedding.
         Producers to crop_queue.
         """
         logger.info("Starting Detection Thread.")
         while self.running:
-            try:
-                frame_id, frame = self.frame_queue.get(timeout=1)
-            except Empty:
+            batch = collect_batch(self.frame_queue, args.det_batch, args.det_batch_wait, timeout=1)
+            if not batch:
                 continue
             
             try:
-                detections = self.detector.detect(frame)
-                if len(detections) > 0:
-                    logger.info(f"Frame {frame_id}: Detected {len(detections)} faces.")
+                all_detections, all_arrays = self.detector.detect_batch([frame for _, _, frame in batch],
+                                                                        return_arrays=True)
+                now = time.monotonic()
+                for (camera_id, frame_id, frame), detections, det_array in zip(batch, all_detections, all_arrays):
+                    cam = self.cameras[camera_id]
+                    crops = [clip_crop(frame, det) for det in detections]
+                    qualities = None
+                    if cam.tracker is not None:
+                        qualities = [face_quality(det, c) if c is not None else 0.0
+                                     for det, c in zip(detections, crops)]
+                    selected = faces_to_embed(cam.tracker, detections, det_array, frame, now, qualities)
+                    cam.sampler.note_faces(len(detections), len(cam.tracker.tracks) if cam.tracker else None)
+                    if len(detections) == 0:
+                        continue
+                    logger.info(f"Camera {camera_id} Frame {frame_id}: Detected {len(detections)} faces, "
+                                f"{len(selected)} to embed.")
                     
-                    for i, det in enumerate(detections):
-                        # Unpack (x1, y1, x2, y2, conf, landmarks)
-                        x1, y1, x2, y2, conf, _ = det
-                        
-                        # Sanity check
-                        h, w = frame.shape[:2]
-                        x1, y1 = max(0, x1), max(0, y1)
-                        x2, y2 = min(w, x2), min(h, y2)
-                        
-                        if x2 <= x1 or y2 <= y1:
-                            continue
-                        
-                        # Crop
-                        face_crop = frame[y1:y2, x1:x2]
+                    # Boxes outside the frame have no crop
+                    selected = [(i, track_id) for i, track_id in selected if crops[i] is not None]
+                    if ALIGN:
+                        # One warp per face, straight from the full frame
+                        faces = align_faces(frame, [detections[i] for i, _ in selected], FACE_SIZE)
+                    else:
+                        faces = [crops[i] for i, _ in selected]
+
+                    for (i, track_id), face_crop in zip(selected, faces):
+                        quality = qualities[i] if qualities is not None else None
                         
-                        # Save temporarily
                         timestamp = datetime.now().strftime("%H%M%S%f")
-                        filename = f"face_{frame_id}_{i}_{timestamp}.jpg"
-                        filepath = os.path.join(DIRS["crops"], filename)
-                        cv2.imwrite(filepath, face_crop)
+                        crop_id = f"face_c{camera_id}_{frame_id}_{i}_{timestamp}"
+                        if TEMP_STORAGE == "disk":
+                            cv2.imwrite(os.path.join(DIRS["crops"], crop_id + ".jpg"), face_crop)
                         
-                        # Push to embedding queue
-                        # We pass the image array too so we don't have to re-read it, 
-                        # but we also pass filepath for reference/logging.
-                        self.crop_queue.put((filepath, face_crop, frame_id))
+                        # Push to embedding queue (the crop stays in memory)
+                        self.crop_queue.put((crop_id, face_crop, camera_id, frame_id, track_id, quality))
                         
             except Exception as e:
                 logger.error(f"Error in detection: {e}")
             
-            self.frame_queue.task_done()
+            for _ in batch:
+                self.frame_queue.task_done()
 
     def thread_embedding(self):
         """
-        Consumes crops.
-        Computes embeddings.
+        Consumes crops in dynamic micro-batches.
+        Computes embeddings with one forward pass per batch.
         Saves temporarily.
         Produces to embed_queue.
         """
         logger.info("Starting Embedding Thread.")
         while self.running:
-            try:
-                filepath, face_img_bgr, frame_id = self.crop_queue.get(timeout=1)
-            except Empty:
+            batch = self.embedder.collect(self.crop_queue, timeout=1)
+            if not batch:
                 continue
-            
+
             try:
-                # Convert BGR (cv2) to RGB (PIL) for facenet
-                img_rgb = cv2.cvtColor(face_img_bgr, cv2.COLOR_BGR2RGB)
-                
-                # Check FaceRecogCore usage:
-                # it has read_image which does cvtColor and returns PIL.
-                # get_embedding_pytorch takes PIL image
-                
-                from PIL import Image
-                img_pil = Image.fromarray(img_rgb)
-                
-                emb = get_embedding_pytorch(
-                    img_pil, 
-                    self.recog_model, 
-                    self.recog_device, 
-                    self.recog_transform
-                )
-                
-                # Save embedding temporarily
-                emb_filename = Path(filepath).stem + ".npy"
-                emb_path = os.path.join(DIRS["embeddings"], emb_filename)
-                np.save(emb_path, emb)
-                
-                self.embed_queue.put((emb, filepath, frame_id))
-                
+                embs = self.embedder.embed([item[1] for item in batch])
+
+                for (crop_id, face_crop, camera_id, frame_id, track_id, quality), emb in zip(batch, embs):
+                    if TEMP_STORAGE == "disk":
+                        np.save(os.path.join(DIRS["embeddings"], crop_id + ".npy"), emb)
+
+                    # Crop travels along so evidence can be saved for matches
+                    self.embed_queue.put((emb, crop_id, face_crop, camera_id, frame_id, track_id, quality))
+
             except Exception as e:
                 logger.error(f"Error in embedding: {e}")
-                
-            self.crop_queue.task_done()
+
+            for _ in batch:
+                self.crop_queue.task_done()
 
     def thread_recognition(self):
         """
         Consumes embeddings.
+        Aggregates them per track (feature bank).
         Matches against Reference DB.
         Logs results.
         """
@@ -441,12 +735,26 @@ class Pipeline:
         
         # Log file for matches
         match_log_path = os.path.join("recognition_log.txt")
+        last_expire = time.monotonic()
         
         while self.running:
+            if self.feature_bank is not None and time.monotonic() - last_expire > self.feature_bank.ttl:
+                self.feature_bank.expire()
+                last_expire = time.monotonic()
             try:
-                emb, crop_path, frame_id = self.embed_queue.get(timeout=1)
+                emb, crop_id, face_crop, camera_id, frame_id, track_id, quality = self.embed_queue.get(timeout=1)
             except Empty:
                 continue
+
+            if track_id is not None and self.feature_bank is not None:
+                key = (camera_id, track_id)
+                if not self.feature_bank.add(key, emb, quality, face_crop, frame_id):
+                    # No better shot for this track: the query would not change
+                    self.embed_queue.task_done()
+                    continue
+                # Query with the track's aggregate; evidence uses its best shot
+                emb = self.feature_bank.query_embedding(key)
+                _, _, face_crop, frame_id = self.feature_bank.best_shot(key)
             
             try:
                 matches = []
@@ -460,22 +768,24 @@ class Pipeline:
                             threshold=0.5 # Get all top k results regardless of threshold initially
                         )
                 
+                cam = self.cameras[camera_id]
                 if matches:
                     top_match = matches[0]
                     score = top_match['score01']
                     
                     # Log the top candidate regardless of threshold for debugging
-                    logger.debug(f"Frame {frame_id}: Top match {top_match['image_file']} with score {score:.3f}")
+                    logger.debug(f"Camera {camera_id} Frame {frame_id}: Top match {top_match['image_file']} with score {score:.3f}")
                     
                     if score >= RECOGNITION_THRESHOLD:
                         # Extract person_id from filename (split by first '_')
                         image_file = top_match['image_file']
                         person_id = image_file.split('_')[0]
+                        evidence_path = self.save_evidence(face_crop, "match", f"{person_id}_{score:.3f}")
 
-                        msg = (f"[MATCH FOUND] Frame: {frame_id} | "
+                        msg = (f"[MATCH FOUND] Camera: {camera_id} ({cam.location}) | Frame: {frame_id} | Track: {track_id} | "
                                f"Person ID: {person_id} (File: {image_file}) | "
                                f"Score: {score:.3f} | "
-                               f"Source Crop: {crop_path}")
+                               f"Source Crop: {evidence_path or crop_id}")
                         
                         logger.info(msg)
                         
@@ -486,18 +796,25 @@ class Pipeline:
                         # Trigger Alert
                         self.alert_manager.send_alert(
                             person_id=person_id,
-                            location=self.location, 
+                            location=cam.location, 
                             confidence=score,
-                            image_path=image_file
+                            image_path=image_file,
+                            camera_id=camera_id
                         )
                     else:
-                        logger.info(f"Frame {frame_id}: Near miss - {top_match['image_file']} ({score:.3f} < {RECOGNITION_THRESHOLD})")
+                        logger.info(f"Camera {camera_id} Frame {frame_id}: Near miss - {top_match['image_file']} ({score:.3f} < {RECOGNITION_THRESHOLD})")
+                        self.save_evidence(face_crop, "near_miss", f"{top_match['image_file'].split('_')[0]}_{score:.3f}")
                         
             except Exception as e:
                 logger.error(f"Error in recognition: {e}")
             
             self.embed_queue.task_done()
 
+    def save_evidence(self, face_crop, kind, name):
+        if self.evidence_writer is None:
+            return None
+        return self.evidence_writer.submit(face_crop, kind, name)
+
     def thread_db_updater(self):
         """
         Periodically updates the reference database.
@@ -523,88 +840,136 @@ class Pipeline:
         # Import CSRNet locally to avoid global dependency if not needed
         try:
             from src.crowd.crowd_monitor import CSRNet, load_csrnet
-            from torchvision import transforms
+            from src.crowd.tiling import TiledDensityEstimator, load_zones
+            from src.crowd.change_gate import ChangeGate
+            from src.crowd.density_store import DensityStore
             
             # Config mock for load_csrnet
             class CrowdConfig:
                 model_path = r"src/crowd/task_two_model_best.pth.tar" # Adjust path as needed
                 use_cuda = torch.cuda.is_available()
+                infer_mode = args.crowd_mode
             
             crowd_cfg = CrowdConfig()
-            if not os.path.exists(crowd_cfg.model_path):
+            if args.crowd_model:
+                crowd_cfg.model_path = args.crowd_model
+            elif not os.path.exists(crowd_cfg.model_path):
                  # Fallback to root if src path fails
                  crowd_cfg.model_path = r"task_two_model_best.pth.tar"
                  
             crowd_model = load_csrnet(crowd_cfg)
             
-            transform = transforms.Compose([
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                     std=[0.229, 0.224, 0.225])
-            ])
+            # Tiled mode keeps full resolution inside the zones; otherwise one 640x360 pass per frame
+            tiled = args.crowd_tile > 0
+            if args.crowd_change_threshold > 0:
+                # Static scenes/tiles reuse their cached density instead of re-running CSRNet
+                self.crowd_gate = ChangeGate(args.crowd_change_threshold, args.crowd_max_staleness)
+            estimator = TiledDensityEstimator(
+                crowd_model,
+                tile_size=args.crowd_tile if tiled else None,
+                overlap=args.crowd_overlap,
+                input_size=None if tiled else (640, 360),
+                scale=args.crowd_scale,
+                device="cuda" if crowd_cfg.use_cuda else "cpu",
+                gate=self.crowd_gate,
+            )
+            zones = load_zones(args.crowd_zones)
+            # Counts, zone counts and downsampled density maps for dashboards (src/crowd/density_store.py)
+            store = DensityStore(args.crowd_store, map_interval=args.crowd_map_interval) if args.crowd_store else None
             
             crowd_threshold = 50
             
             while self.running:
-                # Sleep first or run first? Let's run then sleep.
-                # Use a lock to get the latest frame safely
-                frame_to_process = None
-                with self.latest_frame_lock:
-                    if self.latest_frame is not None:
-                        frame_to_process = self.latest_frame.copy()
+                # Latest frame of every camera; tiles of all cameras share CSRNet batches
+                cams = []
+                frames = []
+                for cam in self.cameras:
+                    with cam.latest_frame_lock:
+                        frame = cam.latest_frame
+                    if frame is not None:
+                        cams.append(cam)
+                        frames.append(frame)
                 
-                if frame_to_process is not None:
+                if frames:
                     try:
-                        # Preprocess
-                        # Resize for consistent inference speed/size (optional but recommended in original script)
-                        frame_resized = cv2.resize(frame_to_process, (640, 360))
-                        img_tensor = transform(cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)).unsqueeze(0)
+                        results = estimator.estimate(frames, [zones.get(str(cam.camera_id)) for cam in cams],
+                                                     keys=[cam.camera_id for cam in cams])
                         
-                        if crowd_cfg.use_cuda:
-                            img_tensor = img_tensor.cuda()
+                        now = time.time()
+                        for cam, res in zip(cams, results):
+                            count = res["count"]
+                            if store is not None:
+                                store.append(cam.camera_id, now, count, res["zones"], res["density"])
+                            zone_info = "".join(f" {name}={c:.1f}" for name, c in res["zones"].items())
+                            logger.info(f"[Crowd Monitor] Camera {cam.camera_id} Current Count: {count:.2f}{zone_info}")
                             
-                        with torch.no_grad():
-                            output = crowd_model(img_tensor)
-                            
-                        density_map = output.squeeze().cpu().numpy()
-                        count = np.sum(density_map)
-                        
-                        logger.info(f"[Crowd Monitor] Current Count: {count:.2f}")
-                        
-                        if count > crowd_threshold:
-                            logger.warning(f"Crowd Density Exceeded: {count:.2f}")
-                            self.alert_manager.send_alert(
-                                person_id="CROWD_ALERT",
-                                location=self.location,
-                                confidence=count,
-                                image_path="crowd_snapshot.jpg", # Placeholder or save actual snapshot
-                                message=f"High crowd density detected: {count:.0f} people at {self.location}"
-                            )
+                            if count > crowd_threshold:
+                                logger.warning(f"Crowd Density Exceeded at camera {cam.camera_id}: {count:.2f}")
+                                self.alert_manager.send_alert(
+                                    person_id="CROWD_ALERT",
+                                    location=cam.location,
+                                    confidence=count,
+                                    image_path="crowd_snapshot.jpg", # Placeholder or save actual snapshot
+                                    message=f"High crowd density detected: {count:.0f} people at {cam.location}",
+                                    camera_id=cam.camera_id
+                                )
                             
                     except Exception as e:
                         logger.error(f"Error in crowd inference: {e}")
                 else:
                     logger.debug("No frame available for crowd monitoring yet.")
 
-                # Wait for 5 minutes (300 seconds)
-                for _ in range(300):
+                # Wait --crowd-interval seconds (5 minutes by default)
+                for _ in range(args.crowd_interval):
                     if not self.running: break
                     time.sleep(1)
+            
+            if store is not None:
+                store.close()
                     
         except ImportError:
             logger.error("Could not import source.crowd.crowd_monitor. Crowd thread disabled.")
         except Exception as e:
             logger.error(f"Crowd thread failed: {e}")
 
+    def log_metrics(self):
+        for q in (self.frame_queue, self.crop_queue, self.embed_queue):
+            st = q.stats()
+            logger.info(f"[Metrics] Queue {q.name}: size={st['size']}/{st['maxsize']} "
+                        f"high_water={st['high_water']} dropped={st['dropped']}")
+        if EXEC_MODE == "process":
+            logger.info(f"[Metrics] Frame rings: dropped={sum(r.dropped for r in self.frame_rings)}")
+        if self.feature_bank is not None:
+            logger.info(f"[Metrics] Feature bank: tracks={len(self.feature_bank)}")
+        for cam in self.cameras:
+            s = cam.sampler
+            logger.info(f"[Metrics] Camera {cam.camera_id}: detection_fps={s.effective_fps:.2f} "
+                        f"interval={s.interval:.1f} motion={s.motion:.2f} tracks={s.active_tracks}")
+        if self.crowd_gate is not None:
+            for camera_id, g in sorted(self.crowd_gate.metrics().items()):
+                logger.info(f"[Metrics] Crowd camera {camera_id}: checks={g['frames']} "
+                            f"skip_rate={g['frame_skip_rate']:.2f} tile_skip_rate={g['tile_skip_rate']:.2f} "
+                            f"staleness={g['staleness']:.0f}s")
+
     def start(self):
         # Start reference DB update in main or background first?
         # Let's do it once synchronously so we have data
         self.update_reference_db()
         
         threads = [
-            threading.Thread(target=self.thread_capture, name="Capture"),
-            threading.Thread(target=self.thread_detection, name="Detection"),
-            threading.Thread(target=self.thread_embedding, name="Embedding"),
+            threading.Thread(target=self.thread_capture, args=(cam,), name=f"Capture-{cam.camera_id}")
+            for cam in self.cameras
+        ]
+        if EXEC_MODE == "process":
+            # Detection and embedding run in worker processes
+            self.start_workers()
+            threads.append(threading.Thread(target=self.thread_worker_results, name="WorkerResults"))
+        else:
+            threads += [
+                threading.Thread(target=self.thread_detection, name="Detection"),
+                threading.Thread(target=self.thread_embedding, name="Embedding"),
+            ]
+        threads += [
             threading.Thread(target=self.thread_recognition, name="Recognition"),
             threading.Thread(target=self.thread_db_updater, name="DBUpdater"),
             threading.Thread(target=self.thread_crowd, name="CrowdMonitor")
@@ -614,14 +979,22 @@ class Pipeline:
             t.start()
             
         try:
+            last_metrics = time.time()
             while True:
                 time.sleep(1)
+                if time.time() - last_metrics >= args.metrics_interval:
+                    self.log_metrics()
+                    last_metrics = time.time()
         except KeyboardInterrupt:
             logger.info("Stopping pipeline...")
             self.running = False
             
         for t in threads:
             t.join()
+        if EXEC_MODE == "process":
+            self.stop_workers()
+        if self.evidence_writer is not None:
+            self.evidence_writer.stop()
         logger.info("Pipeline terminated.")
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ class AlertManager:
     def __init__(self, mongo_uri, db_name="test", collection_name="alerts", cooldown_seconds=300):
         self.logger = logging.getLogger("AlertManager")
         self.cooldown_seconds = cooldown_seconds
-        self.last_alert_time = {}  # {person_id: timestamp}
+        self.last_alert_time = {}  # {(person_id, camera_id): timestamp}
         self.collection = None
         self.reports_collection = None
         
@@ -30,10 +30,10 @@ class AlertManager:
         else:
             self.logger.warning("pymongo not installed. Alerts will not be sent.")
 
-    def check_cooldown(self, person_id):
-        """Returns True if alert can be sent (cooldown passed or new person)."""
+    def check_cooldown(self, person_id, camera_id=None):
+        """Returns True if alert can be sent (cooldown passed or new person/camera)."""
         now = time.time()
-        last_time = self.last_alert_time.get(person_id, 0)
+        last_time = self.last_alert_time.get((person_id, camera_id), 0)
         
         if now - last_time > self.cooldown_seconds:
             return True
@@ -65,14 +65,14 @@ class AlertManager:
             self.logger.warning(f"Failed to fetch name for {person_id}: {e}")
         return None
 
-    def send_alert(self, person_id, location="Unknown", confidence=0.0, image_path="", message=None):
-        """Sends an alert to MongoDB."""
+    def send_alert(self, person_id, location="Unknown", confidence=0.0, image_path="", message=None, camera_id=None):
+        """Sends an alert to MongoDB. Cooldown is tracked per person and camera."""
         if not self.collection:
             return
 
         # Cooldown check only for person alerts, maybe skip for CROWD_ALERT or handle separately?
-        if not self.check_cooldown(person_id):
-            self.logger.debug(f"Alert cooldown active for {person_id}. Skipping.")
+        if not self.check_cooldown(person_id, camera_id):
+            self.logger.debug(f"Alert cooldown active for {person_id} (camera {camera_id}). Skipping.")
             return
 
         # Fetch Name if not CROWD_ALERT
@@ -103,10 +103,12 @@ class AlertManager:
             "status": "new",
             "message": final_message
         }
+        if camera_id is not None:
+            alert_doc["camera_id"] = camera_id
 
         try:
             self.collection.insert_one(alert_doc)
             self.logger.info(f"Alert sent: {final_message}")
-            self.last_alert_time[person_id] = time.time()
+            self.last_alert_time[(person_id, camera_id)] = time.time()
         except Exception as e:
             self.logger.error(f"Failed to insert alert: {e}")
@@ -0,0 +1,99 @@
+import os
+import time
+import logging
+import threading
+from queue import Queue, Full, Empty
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+
+class EvidenceWriter:
+    """
+    Asynchronous, bounded writer for face crops worth keeping (confirmed
+    matches and, optionally, near-misses). JPEG encoding and file I/O run on
+    a background thread so the recognition loop never blocks on disk; when
+    the queue is full new evidence is dropped and counted.
+
+    Layout: <root>/<YYYYMMDD>/<kind>/<HHMMSSffffff>_<name>.jpg
+    Retention: at most max_files crops and nothing older than max_age_days.
+    """
+    def __init__(self, root="evidence", kinds=("match",), max_queue=64,
+                 max_files=5000, max_age_days=7, jpeg_quality=90, prune_interval=60):
+        self.logger = logging.getLogger("EvidenceWriter")
+        self.root = Path(root)
+        self.kinds = set(kinds)
+        self.max_files = max_files
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.jpeg_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self.prune_interval = prune_interval
+
+        self.queue = Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.running = True
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="EvidenceWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, crop_bgr, kind, name):
+        """Queues a crop for writing. Returns the target path, or None if skipped."""
+        if kind not in self.kinds or crop_bgr is None:
+            return None
+        now = datetime.now()
+        path = self.root / now.strftime("%Y%m%d") / kind / f"{now.strftime('%H%M%S%f')}_{name}.jpg"
+        try:
+            self.queue.put_nowait((path, crop_bgr))
+        except Full:
+            self.dropped += 1
+            return None
+        return str(path)
+
+    def _run(self):
+        last_prune = 0.0
+        while self.running or not self.queue.empty():
+            try:
+                path, crop = self.queue.get(timeout=1)
+            except Empty:
+                path = None
+            if path is not None:
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    cv2.imwrite(str(path), crop, self.jpeg_params)
+                    self.written += 1
+                except Exception as e:
+                    self.logger.error(f"Failed to write evidence {path}: {e}")
+            if time.time() - last_prune > self.prune_interval:
+                self.prune()
+                last_prune = time.time()
+
+    def prune(self):
+        """Applies the retention policy: age limit first, then file-count limit."""
+        try:
+            files = sorted(self.root.glob("*/*/*.jpg"), key=lambda p: p.stat().st_mtime)
+        except OSError as e:
+            self.logger.warning(f"Evidence prune skipped: {e}")
+            return
+        now = time.time()
+        excess = len(files) - self.max_files if self.max_files else 0
+        for i, p in enumerate(files):
+            try:
+                too_old = self.max_age_seconds and now - p.stat().st_mtime > self.max_age_seconds
+                if i < excess or too_old:
+                    p.unlink()
+                else:
+                    break  # sorted by age: the rest are newer and within the count limit
+            except OSError:
+                pass
+        # Drop empty day/kind directories
+        for d in sorted(self.root.glob("*/*"), reverse=True) + sorted(self.root.glob("*")):
+            if d.is_dir():
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5)
@@ -0,0 +1,97 @@
+"""
+CSRNet inference-mode benchmark
+-------------------------------
+Runs every mode of csrnet_runtime on crowd.jpg-style images (resized to
+--size, as crowd_monitor does) and reports latency and count deviation from
+the fp32 baseline.
+
+    python bench_csrnet.py --images crowd.jpg --model_path task_two_model_best.pth.tar
+    python -m src.crowd.bench_csrnet --model_path none --batch 4     # random weights, offline
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+try:
+    from src.crowd.crowd_monitor import CSRNet
+    from src.crowd.csrnet_runtime import INFER_MODES, CSRNetRunner, preprocess_bgr
+    from src.crowd.slim_checkpoint import load_state_dict
+except ImportError:  # run as a script from src/crowd
+    from crowd_monitor import CSRNet
+    from csrnet_runtime import INFER_MODES, CSRNetRunner, preprocess_bgr
+    from slim_checkpoint import load_state_dict
+
+
+def load_frames(paths, size, batch):
+    frames = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is None:
+            print(f"[warn] Could not read {p}")
+            continue
+        frames.append(cv2.resize(img, size))
+    if not frames:
+        print("[info] No images found; using random frames.")
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)]
+    # Repeat to fill the batch
+    return [frames[i % len(frames)] for i in range(max(batch, len(frames)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=str, nargs="*", default=["crowd.jpg"])
+    parser.add_argument("--model_path", type=str, default="task_two_model_best.pth.tar",
+                        help="CSRNet checkpoint, or 'none' for random weights")
+    parser.add_argument("--size", type=int, nargs=2, default=[640, 360], help="Inference width height")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--modes", type=str, nargs="*", default=list(INFER_MODES), choices=INFER_MODES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    # load_weights=True skips the ImageNet VGG16 download; the checkpoint overwrites everything anyway
+    base = CSRNet(load_weights=True)
+    if args.model_path != "none":
+        base.load_state_dict(load_state_dict(args.model_path))
+    state = base.state_dict()
+
+    frames = load_frames(args.images, tuple(args.size), args.batch)
+    x = preprocess_bgr(frames, device)
+
+    print(f"device={device} batch={len(frames)} size={args.size[0]}x{args.size[1]} threads={torch.get_num_threads()}")
+    print(f"{'mode':14s} {'active':14s} {'latency ms':>11s} {'count':>10s} {'dev %':>8s}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            model = CSRNet(load_weights=True)
+            model.load_state_dict(state)
+            model = model.to(device).eval()
+            runner = CSRNetRunner(model, mode, onnx_path=os.path.join(tmp, "csrnet.onnx"), threads=args.threads)
+            counts = runner(x).sum(dim=(1, 2, 3)).cpu().numpy()  # warm-up (and jit/onnx first run)
+            best = float("inf")
+            for _ in range(args.repeats):
+                t0 = time.perf_counter()
+                out = runner(x)
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+                best = min(best, time.perf_counter() - t0)
+            if baseline is None:
+                baseline = counts
+            dev = float(np.max(np.abs(counts - baseline) / np.maximum(np.abs(baseline), 1e-6))) * 100
+            print(f"{mode:14s} {runner.mode:14s} {best * 1000:11.1f} {float(counts.mean()):10.2f} {dev:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
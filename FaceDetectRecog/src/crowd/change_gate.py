@@ -0,0 +1,119 @@
+"""
+Temporal change gate for CSRNet
+-------------------------------
+Crowd scenes are mostly static between two samples. ChangeGate keeps, per
+camera, a grayscale thumbnail of the frame at density resolution (1/8) as of
+the last inference of each tile, plus that tile's density output. On a new
+frame a tile is recomputed only if the mean absolute thumbnail difference
+inside it reaches `threshold` (the same measure as the face sampler's motion
+threshold), or its cached output is older than `max_staleness` seconds.
+When no tile changed, CSRNet is skipped entirely and the cached density map
+and count are reused.
+
+Skip rates and count staleness (age of the oldest tile output in the map)
+are kept per camera for the metrics log; they are locked, since the log is
+read from another thread than the one running the gate.
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class TileCache:
+    """Cached tile outputs of one camera for one TilePlan."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        n = len(plan.tiles)
+        self.ref_thumb = None
+        self.densities = [None] * n
+        self.times = np.full(n, -np.inf)
+        self.result = None  # last stitched result, reused when nothing changed
+
+
+class GateStats:
+    def __init__(self):
+        self.frames = 0
+        self.skipped_frames = 0
+        self.tiles = 0
+        self.skipped_tiles = 0
+
+    def as_dict(self):
+        return {
+            "frames": self.frames,
+            "frame_skip_rate": self.skipped_frames / self.frames if self.frames else 0.0,
+            "tile_skip_rate": self.skipped_tiles / self.tiles if self.tiles else 0.0,
+            "staleness": 0.0,
+        }
+
+
+class ChangeGate:
+    def __init__(self, threshold=4.0, max_staleness=600.0):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self.caches = {}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    @staticmethod
+    def thumbnail(frame, plan):
+        dh, dw = plan.inv_wsum.shape
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (dw, dh), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def select(self, key, plan, frame, now=None):
+        """
+        Returns (cache, indices of plan.tiles to recompute, thumbnail of frame).
+        key identifies the camera; a new plan (frame size / zones changed) resets its cache.
+        """
+        now = time.monotonic() if now is None else now
+        cache = self.caches.get(key)
+        if cache is None or cache.plan is not plan:
+            cache = self.caches[key] = TileCache(plan)
+        thumb = self.thumbnail(frame, plan)
+        if cache.ref_thumb is None:
+            return cache, list(range(len(plan.tiles))), thumb
+        diff = np.abs(thumb - cache.ref_thumb)
+        todo = []
+        for i, (sy, sx) in enumerate(plan.tiles):
+            stale = now - cache.times[i] >= self.max_staleness
+            if stale or cache.densities[i] is None or diff[plan.density_slice(sy, sx)].mean() >= self.threshold:
+                todo.append(i)
+        return cache, todo, thumb
+
+    def commit(self, key, cache, todo, thumb, densities, now=None):
+        """Stores recomputed tile outputs and updates the camera's stats."""
+        now = time.monotonic() if now is None else now
+        plan = cache.plan
+        if cache.ref_thumb is None:
+            cache.ref_thumb = thumb.copy()
+        for i, d in zip(todo, densities):
+            cache.densities[i] = d
+            cache.times[i] = now
+            # The reference only moves for recomputed tiles, so slow drift still adds up
+            sl = plan.density_slice(*plan.tiles[i])
+            cache.ref_thumb[sl] = thumb[sl]
+
+        with self.stats_lock:
+            st = self.stats.setdefault(key, GateStats())
+            st.frames += 1
+            st.skipped_frames += int(not todo)
+            st.tiles += len(plan.tiles)
+            st.skipped_tiles += len(plan.tiles) - len(todo)
+
+    def metrics(self, reset=False):
+        """Per-camera skip rates, plus staleness as of now (age of the oldest cached tile)."""
+        now = time.monotonic()
+        out = {}
+        with self.stats_lock:
+            for key, st in self.stats.items():
+                out[key] = st.as_dict()
+                cache = self.caches.get(key)
+                if cache is not None and len(cache.times):
+                    out[key]["staleness"] = float(now - cache.times.min())
+            if reset:
+                self.stats = {}
+        return out
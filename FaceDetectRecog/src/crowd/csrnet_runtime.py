@@ -0,0 +1,145 @@
+"""
+CSRNet inference modes
+----------------------
+Wraps a loaded CSRNet so callers keep doing `density = runner(img_tensor)`
+while the forward pass runs in one of these modes:
+
+    fp32           eager, NCHW (the original behaviour)
+    channels_last  eager, NHWC memory format (faster convs with oneDNN / cuDNN)
+    jit            torch.jit.trace + freeze, channels_last
+    fp16           autocast float16 (CUDA only)
+    bf16           autocast bfloat16 (CUDA with bf16 support, or CPUs with AVX512-BF16/AMX)
+    onnx           exported once to ONNX (dynamic batch/height/width), run by onnxruntime
+
+Modes that the device does not support fall back to fp32 with a warning.
+The output is always a float32 density map (n, 1, h, w) on the model's device.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import torch
+
+INFER_MODES = ("fp32", "channels_last", "jit", "fp16", "bf16", "onnx")
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def preprocess_bgr(frames, device="cpu"):
+    """
+    Same-size BGR uint8 frames -> ImageNet-normalised (n, 3, h, w) float tensor,
+    equivalent to ToTensor + Normalize on the RGB image, in one vectorised pass.
+    """
+    batch = np.stack(frames)[..., ::-1]  # BGR -> RGB
+    x = torch.from_numpy(np.ascontiguousarray(batch)).to(device).permute(0, 3, 1, 2).float()
+    mean = torch.as_tensor(IMAGENET_MEAN * 255.0, device=x.device).view(1, 3, 1, 1)
+    std = torch.as_tensor(IMAGENET_STD * 255.0, device=x.device).view(1, 3, 1, 1)
+    return (x - mean) / std
+
+
+def bf16_supported(device):
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    # oneDNN runs bf16 natively on AVX512-BF16 / AMX CPUs; elsewhere it is emulated and slow
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def file_hash(path, length=8):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+def export_onnx(model, path, opset=18, example_size=(360, 640)):
+    """Exports CSRNet to a single ONNX file with dynamic batch, height and width."""
+    import onnx
+
+    tmp = path + ".tmp"
+    x = torch.randn(1, 3, *example_size)
+    with torch.no_grad():
+        torch.onnx.export(model.float().cpu().eval(), x, tmp, input_names=["images"], output_names=["density"],
+                          dynamic_axes={"images": {0: "batch", 2: "height", 3: "width"},
+                                        "density": {0: "batch", 2: "h", 3: "w"}},
+                          opset_version=opset, do_constant_folding=True)
+    # Pack external weight files (newer torch exporters) into one file
+    onnx.save(onnx.load(tmp), path)
+    for f in (tmp, tmp + ".data"):
+        if os.path.exists(f):
+            os.remove(f)
+    return path
+
+
+class CSRNetRunner:
+    """
+    Callable CSRNet in one of INFER_MODES. `model` is an eval-mode CSRNet already on its device.
+    onnx_path: where the ONNX export is cached (mode 'onnx'); threads: onnxruntime intra-op threads.
+    """
+
+    def __init__(self, model, mode="fp32", onnx_path=None, threads=None):
+        if mode not in INFER_MODES:
+            raise ValueError(f"Unknown CSRNet inference mode: {mode}")
+        self.model = model.eval()
+        self.device = next(model.parameters()).device
+        self.session = None
+        self.autocast_dtype = None
+
+        if mode == "fp16" and self.device.type != "cuda":
+            print("[warn] fp16 autocast needs CUDA; using fp32.")
+            mode = "fp32"
+        if mode == "bf16" and not bf16_supported(self.device):
+            print("[warn] bf16 is not supported on this device; using fp32.")
+            mode = "fp32"
+        self.mode = mode
+
+        if mode in ("channels_last", "jit"):
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if mode == "jit":
+            example = torch.zeros(1, 3, 360, 640, device=self.device).contiguous(memory_format=torch.channels_last)
+            with torch.no_grad():
+                self.model = torch.jit.freeze(torch.jit.trace(self.model, example))
+        elif mode == "fp16":
+            self.autocast_dtype = torch.float16
+        elif mode == "bf16":
+            self.autocast_dtype = torch.bfloat16
+        elif mode == "onnx":
+            self._load_onnx(onnx_path or "csrnet.onnx", threads)
+
+    def _load_onnx(self, path, threads):
+        import onnxruntime
+
+        if not os.path.exists(path):
+            print(f"[info] Exporting CSRNet to ONNX: {path}")
+            export_onnx(self.model, path)
+            self.model.to(self.device)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+            options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        if self.device.type == "cuda" and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = onnxruntime.InferenceSession(path, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        if self.session is not None:
+            out = self.session.run(None, {self.input_name: x.detach().cpu().numpy().astype(np.float32)})[0]
+            return torch.from_numpy(out).to(self.device)
+        x = x.to(self.device, non_blocking=True)
+        if self.mode in ("channels_last", "jit"):
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            if self.autocast_dtype is not None:
+                with torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype):
+                    out = self.model(x)
+            else:
+                out = self.model(x)
+        return out.float()
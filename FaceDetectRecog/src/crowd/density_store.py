@@ -0,0 +1,384 @@
+"""
+Crowd density time-series store
+-------------------------------
+Append-only, memory-mapped store of per-camera crowd counts and density maps:
+
+    <root>/<camera>/meta.json     zone names (fixed slots), map size
+    <root>/<camera>/1s.bin        one record per second: t, mean count, mean zone counts
+    <root>/<camera>/1m.bin        rollups: t (bucket start), n, mean, max, zone means, zone maxes
+    <root>/<camera>/5m.bin
+    <root>/<camera>/1h.bin
+    <root>/<camera>/maps.bin      t + float16 density map (sum preserved), every map_interval s
+
+All files hold fixed-size numpy records, so they are only ever appended to
+and are read back with np.memmap + binary search on t; a dashboard never
+touches video or CSRNet. A 1s record is written once its second is over (when
+the next second's sample arrives, or after flush_interval without samples, so
+a stalled camera or a crash loses at most that much) and a rollup record once
+its bucket closes; open rollup buckets are rebuilt from the 1s records on
+restart. Readers open the store with readonly=True: no file is created or
+opened for writing, and each query sees what the writer has flushed so far.
+
+    store = DensityStore("crowd_store")
+    store.append(camera_id, time.time(), count, {"gate": 12.5}, density_map)
+    DensityStore("crowd_store", readonly=True).occupancy(cameras=[0, 1], start=t0, end=t1)
+
+    python -m src.crowd.density_store --store crowd_store --last 3600
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ROLLUPS = (("1m", 60), ("5m", 300), ("1h", 3600))
+RESOLUTIONS = ("1s",) + tuple(name for name, _ in ROLLUPS)
+
+
+def sample_dtype(max_zones):
+    return np.dtype([("t", "<i8"), ("count", "<f4"), ("zones", "<f4", (max_zones,))])
+
+
+def rollup_dtype(max_zones):
+    return np.dtype([("t", "<i8"), ("n", "<i4"), ("mean", "<f4"), ("max", "<f4"),
+                     ("zone_mean", "<f4", (max_zones,)), ("zone_max", "<f4", (max_zones,))])
+
+
+def map_dtype(map_size):
+    return np.dtype([("t", "<i8"), ("map", "<f2", tuple(map_size))])
+
+
+def downsample_density(density, map_size):
+    """Area-resamples a density map to map_size (h, w), preserving its sum (the count)."""
+    h, w = density.shape[:2]
+    mh, mw = map_size
+    small = cv2.resize(density.astype(np.float32), (mw, mh), interpolation=cv2.INTER_AREA)
+    return small * (h * w) / float(mh * mw)
+
+
+class _Bucket:
+    def __init__(self, start, max_zones):
+        self.start = start
+        self.n = 0
+        self.sum = 0.0
+        self.max = -np.inf
+        self.zone_sum = np.zeros(max_zones, dtype=np.float64)
+        self.zone_max = np.full(max_zones, -np.inf)
+
+    def add(self, count, zones):
+        self.n += 1
+        self.sum += count
+        self.max = max(self.max, count)
+        self.zone_sum += zones
+        self.zone_max = np.maximum(self.zone_max, zones)
+
+    def record(self, dtype):
+        rec = np.zeros(1, dtype=dtype)
+        rec["t"] = self.start
+        rec["n"] = self.n
+        rec["mean"] = self.sum / max(self.n, 1)
+        rec["max"] = self.max
+        rec["zone_mean"] = self.zone_sum / max(self.n, 1)
+        rec["zone_max"] = np.where(np.isfinite(self.zone_max), self.zone_max, 0.0)
+        return rec
+
+
+class CameraSeries:
+    """
+    Files of one camera. Appends are serialised by the store's lock.
+    readonly: the camera must exist; nothing is created or opened for writing.
+    """
+
+    def __init__(self, path, max_zones=8, map_size=(36, 64), map_interval=60, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        meta_path = os.path.join(path, "meta.json")
+        if readonly or os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            os.makedirs(path, exist_ok=True)
+            meta = {"zones": [], "max_zones": max_zones, "map_size": list(map_size), "map_interval": map_interval}
+            self._write_meta(meta)
+        self.meta = meta
+        self.zone_names = list(meta["zones"])
+        self.max_zones = int(meta["max_zones"])
+        self.map_size = tuple(meta["map_size"])
+        self.map_interval = int(meta["map_interval"])
+        self.dtypes = {"1s": sample_dtype(self.max_zones), "maps": map_dtype(self.map_size)}
+        for name, _ in ROLLUPS:
+            self.dtypes[name] = rollup_dtype(self.max_zones)
+        self.files = {} if readonly else {name: open(self.file(name), "ab") for name in self.dtypes}
+
+        samples = self.read("1s")
+        self.last_t = int(samples["t"][-1]) if len(samples) else None
+        maps = self.read("maps")
+        self.last_map_t = int(maps["t"][-1]) if len(maps) else None
+        self.pending = None  # samples of the current second
+        self.pending_at = None  # monotonic time of its last sample
+        self.buckets = {}
+        for name, seconds in ROLLUPS:
+            # Rebuild the open bucket from the samples after the last closed one
+            rolled = self.read(name)
+            start = int(rolled["t"][-1]) + seconds if len(rolled) else None
+            tail = samples if start is None else samples[samples["t"] >= start]
+            for rec in tail:
+                self._roll(name, seconds, int(rec["t"]), float(rec["count"]), rec["zones"])
+
+    def file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _write_meta(self, meta):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def read(self, name):
+        """Memory-mapped records of one file (empty array if there are none yet)."""
+        dtype = self.dtypes[name]
+        path = self.file(name)
+        n = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+        if n == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+    def zone_slots(self, zone_counts):
+        """Zone counts -> fixed-width vector; new zone names take free slots (extra ones are dropped)."""
+        vec = np.zeros(self.max_zones, dtype=np.float32)
+        for name, c in (zone_counts or {}).items():
+            if name not in self.zone_names:
+                if len(self.zone_names) >= self.max_zones:
+                    continue
+                self.zone_names.append(name)
+                self.meta["zones"] = self.zone_names
+                self._write_meta(self.meta)
+            vec[self.zone_names.index(name)] = c
+        return vec
+
+    def open_record(self, name):
+        """Record of the still open 1s second or rollup bucket (None if there is none)."""
+        bucket = self.pending if name == "1s" else self.buckets.get(name)
+        if bucket is None:
+            return None
+        if name == "1s":
+            rec = np.zeros(1, dtype=self.dtypes["1s"])
+            rec["t"], rec["count"], rec["zones"] = bucket.start, bucket.sum / bucket.n, bucket.zone_sum / bucket.n
+            return rec
+        return bucket.record(self.dtypes[name])
+
+    def _roll(self, name, seconds, t, count, zones):
+        start = t - t % seconds
+        bucket = self.buckets.get(name)
+        if bucket is not None and bucket.start != start:
+            self.files[name].write(bucket.record(self.dtypes[name]).tobytes())
+            self.files[name].flush()
+            bucket = None
+        if bucket is None:
+            bucket = self.buckets[name] = _Bucket(start, self.max_zones)
+        bucket.add(count, zones)
+
+    def append(self, t, count, zone_counts=None, density=None):
+        t = int(t)
+        if self.last_t is not None and (t < self.last_t or (t == self.last_t and self.pending is None)):
+            return False  # append-only: samples of already written seconds are dropped
+        zones = self.zone_slots(zone_counts)
+        # Samples within one second are averaged into a single 1s record
+        if self.pending is not None and self.pending.start != t:
+            self.flush()
+        if self.pending is None:
+            self.pending = _Bucket(t, self.max_zones)
+        self.pending.add(float(count), zones)
+        self.pending_at = time.monotonic()
+        self.last_t = t
+        if density is not None and (self.last_map_t is None or t - self.last_map_t >= self.map_interval):
+            mrec = np.zeros(1, dtype=self.dtypes["maps"])
+            mrec["t"] = t
+            mrec["map"] = downsample_density(density, self.map_size).astype(np.float16)
+            self.files["maps"].write(mrec.tobytes())
+            self.files["maps"].flush()
+            self.last_map_t = t
+        return True
+
+    def flush_idle(self, idle):
+        """Flushes the pending second if no sample has arrived for idle seconds."""
+        if self.pending is not None and time.monotonic() - self.pending_at >= idle:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending second and feeds it to the rollups."""
+        p = self.pending
+        if p is None:
+            return
+        self.pending = None
+        rec = np.zeros(1, dtype=self.dtypes["1s"])
+        rec["t"], rec["count"], rec["zones"] = p.start, p.sum / p.n, p.zone_sum / p.n
+        self.files["1s"].write(rec.tobytes())
+        self.files["1s"].flush()
+        for name, seconds in ROLLUPS:
+            self._roll(name, seconds, p.start, float(rec["count"][0]), rec["zones"][0])
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+
+class DensityStore:
+    """
+    flush_interval: a pending second is written after this many seconds without a
+    new sample, by a background thread.
+    readonly: for dashboards/CLI queries next to a running writer. Series are
+    reopened on every query, so new zones and the latest flushed seconds show up.
+    """
+
+    def __init__(self, root="crowd_store", max_zones=8, map_size=(36, 64), map_interval=60,
+                 flush_interval=1.0, readonly=False):
+        self.root = root
+        self.max_zones = max_zones
+        self.map_size = map_size
+        self.map_interval = map_interval
+        self.flush_interval = flush_interval
+        self.readonly = readonly
+        self.series = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        if not readonly:
+            os.makedirs(root, exist_ok=True)
+            self._flusher = threading.Thread(target=self._flush_loop, name="DensityStoreFlush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            with self.lock:
+                for s in self.series.values():
+                    s.flush_idle(self.flush_interval)
+
+    def cameras(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def _series(self, camera):
+        """Series of a camera; None for a camera a readonly store has no data of."""
+        key = str(camera)
+        path = os.path.join(self.root, key)
+        if self.readonly:
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                return None
+            return CameraSeries(path, readonly=True)
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = CameraSeries(path, self.max_zones, self.map_size, self.map_interval)
+        return s
+
+    def append(self, camera, t, count, zone_counts=None, density=None):
+        """Adds one sample (t in epoch seconds). Returns False if it was older than the last one."""
+        if self.readonly:
+            raise RuntimeError("DensityStore opened readonly")
+        with self.lock:
+            return self._series(camera).append(t, count, zone_counts, density)
+
+    @staticmethod
+    def pick_resolution(span):
+        if span <= 3600:
+            return "1s"
+        if span <= 6 * 3600:
+            return "1m"
+        if span <= 2 * 86400:
+            return "5m"
+        return "1h"
+
+    def occupancy(self, cameras=None, start=None, end=None, resolution="auto", zones=None):
+        """
+        Occupancy of each camera over [start, end) (epoch seconds; default: the last hour).
+        Returns {camera: {'resolution', 't', 'count', 'max', 'zones': {name: counts}}} where
+        count is the bucket mean (the second's mean at '1s') and max the bucket peak;
+        the last point may be a still open bucket.
+        zones restricts the returned zone series to these names.
+        """
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+        if resolution == "auto":
+            resolution = self.pick_resolution(end - start)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        cameras = self.cameras() if cameras is None else [str(c) for c in cameras]
+
+        out = {}
+        for cam in cameras:
+            if not os.path.isdir(os.path.join(self.root, cam)):
+                continue
+            with self.lock:
+                series = self._series(cam)
+                if series is None:
+                    continue
+                recs = series.read(resolution)
+                current = series.open_record(resolution)
+            lo, hi = np.searchsorted(recs["t"], [start, end], side="left")
+            recs = np.array(recs[lo:hi])  # copy out of the memmap
+            if current is not None and start <= current["t"][0] < end:
+                # The open second/bucket so far, so the latest samples show up right away
+                recs = np.concatenate([recs, current])
+            if resolution == "1s":
+                count, peak, zone_vals = recs["count"], recs["count"], recs["zones"]
+            else:
+                count, peak, zone_vals = recs["mean"], recs["max"], recs["zone_mean"]
+            names = series.zone_names if zones is None else [z for z in zones if z in series.zone_names]
+            out[cam] = {
+                "resolution": resolution,
+                "t": recs["t"],
+                "count": count,
+                "max": peak,
+                "zones": {name: zone_vals[:, series.zone_names.index(name)] for name in names},
+            }
+        return out
+
+    def density_maps(self, camera, start=None, end=None):
+        """(t, maps) of the stored float16 density maps of one camera in [start, end)."""
+        end = time.time() if end is None else end
+        start = 0 if start is None else start
+        with self.lock:
+            series = self._series(camera)
+            if series is None:
+                return np.zeros(0, dtype=np.int64), np.zeros((0,) + tuple(self.map_size), dtype=np.float16)
+            recs = series.read("maps")
+        lo, hi = np.searchsorted(recs["t"], [start, end], side="left")
+        return np.array(recs["t"][lo:hi]), np.array(recs["map"][lo:hi])
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self.lock:
+            for s in self.series.values():
+                s.close()
+            self.series = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query crowd occupancy from a density store")
+    parser.add_argument("--store", type=str, default="crowd_store")
+    parser.add_argument("--cameras", type=str, nargs="*", default=None)
+    parser.add_argument("--last", type=float, default=3600, help="Window length in seconds, ending now")
+    parser.add_argument("--resolution", type=str, default="auto", choices=("auto",) + RESOLUTIONS)
+    args = parser.parse_args()
+
+    store = DensityStore(args.store, readonly=True)
+    end = time.time()
+    for cam, series in store.occupancy(args.cameras, end - args.last, end, args.resolution).items():
+        print(f"Camera {cam} ({series['resolution']}, {len(series['t'])} points)")
+        for i, t in enumerate(series["t"]):
+            zones = " ".join(f"{name}={vals[i]:.1f}" for name, vals in series["zones"].items())
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(t)))
+            print(f"  {stamp}  count={series['count'][i]:.1f} max={series['max'][i]:.1f} {zones}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -43,11 +43,12 @@ class CSRNet(nn.Module):
         self.backend = make_layers(self.backend_feat, in_channels=512, dilation=True)
         self.output_layer = nn.Conv2d(64, 1, kernel_size=1)
 
+        # load_weights=True: a checkpoint follows, so skip the ImageNet VGG16 frontend init
         if not load_weights:
             mod = models.vgg16(pretrained=True)
-            for i in range(len(list(self.frontend.state_dict().items()))):
-                list(self.frontend.state_dict().items())[i][1].data[:] = \
-                    list(mod.state_dict().items())[i][1].data[:]
+            with torch.no_grad():
+                for dst, src in zip(self.frontend.state_dict().values(), mod.state_dict().values()):
+                    dst.copy_(src)
 
     def forward(self, x):
         x = self.frontend(x)
@@ -64,7 +65,7 @@ def initialize():
     All config variables stored here
     """
     class Config:
-        # Path to pretrained checkpoint (.pth.tar)
+        # Path to pretrained checkpoint (.pth.tar, or a slim one from slim_checkpoint.py)
         model_path = r".\task_two_model_best.pth.tar"
 
         # Path to image to predict on
@@ -85,8 +86,8 @@ def initialize():
 def predict_density():
     cfg = initialize()
 
-    # Load model
-    model = CSRNet()
+    # Load model (the checkpoint holds every weight, so the ImageNet VGG16 init is skipped)
+    model = CSRNet(load_weights=True)
     checkpoint = torch.load(cfg.model_path, map_location='cuda' if cfg.use_cuda else 'cpu')
     model.load_state_dict(checkpoint['state_dict'])
     model.eval()
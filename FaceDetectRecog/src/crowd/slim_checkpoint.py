@@ -0,0 +1,65 @@
+"""
+CSRNet checkpoint slimming
+--------------------------
+Training checkpoints (.pth.tar) carry the optimizer state, epoch and best
+score next to the weights, in the legacy pickle format. For inference only
+`state_dict` is needed. This tool saves it alone in torch's zip format, which
+loads with mmap and weights_only, optionally as float16 (half the size; the
+weights are cast back to float32 on load):
+
+    python slim_checkpoint.py task_two_model_best.pth.tar                  # -> task_two_model_best_slim.pth
+    python slim_checkpoint.py task_two_model_best.pth.tar --half -o csrnet_fp16.pth
+
+The result keeps the {'state_dict': ...} layout, so every loader of the
+original checkpoint accepts it.
+"""
+
+import argparse
+import os
+import pickle
+import time
+
+import torch
+
+
+def load_state_dict(path, map_location="cpu"):
+    """float32 state_dict of a slim or a full training checkpoint."""
+    try:
+        # Slim checkpoints: zip format, memory-mapped, no unpickling of arbitrary objects
+        checkpoint = torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+    except (RuntimeError, pickle.UnpicklingError):
+        # Legacy-format training checkpoint (optimizer state, numpy scalars, ...)
+        checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+    state_dict = checkpoint.get("state_dict", checkpoint)
+    return {k: v.float() for k, v in state_dict.items()}
+
+
+def slim_checkpoint(src, dst, half=False):
+    state_dict = load_state_dict(src)
+    if half:
+        state_dict = {k: v.half() for k, v in state_dict.items()}
+    torch.save({"state_dict": state_dict}, dst)
+    return dst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strip a CSRNet training checkpoint down to its weights")
+    parser.add_argument("checkpoint", type=str)
+    parser.add_argument("-o", "--output", type=str, default=None, help="Default: <checkpoint>_slim.pth")
+    parser.add_argument("--half", action="store_true", help="Store the weights as float16")
+    args = parser.parse_args()
+
+    stem = args.checkpoint[:-len(".pth.tar")] if args.checkpoint.endswith(".pth.tar") else os.path.splitext(args.checkpoint)[0]
+    dst = args.output or f"{stem}_slim.pth"
+    slim_checkpoint(args.checkpoint, dst, half=args.half)
+
+    src_mb = os.path.getsize(args.checkpoint) / 1e6
+    dst_mb = os.path.getsize(dst) / 1e6
+    t0 = time.perf_counter()
+    load_state_dict(dst)
+    print(f"[info] {args.checkpoint} ({src_mb:.1f} MB) -> {dst} ({dst_mb:.1f} MB), "
+          f"loads in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Tiled, zone-aware CSRNet density estimation
+-------------------------------------------
+Resizing a 4K frame to 640x360 erases small, distant heads, while running
+CSRNet on the full frame is too slow. TiledDensityEstimator instead:
+
+  1. optionally rescales the frame (scale, or a fixed input_size),
+  2. covers only the bounding box of the monitored zones with overlapping
+     tile_size x tile_size tiles, dropping tiles that touch no zone,
+  3. runs all tiles of all frames through CSRNet in batches,
+  4. stitches the 1/8-resolution density maps with feathered (linear ramp)
+     weights across the overlaps, normalised so every pixel's weights sum to 1,
+  5. returns the total count inside the zones and one count per zone.
+
+Zones are polygons in normalised frame coordinates (0..1), so the same
+config works for any resolution, e.g.
+    {"entrance": [[0.0, 0.5], [0.4, 0.5], [0.4, 1.0], [0.0, 1.0]]}
+Without zones the whole frame is monitored.
+"""
+
+import json
+
+import cv2
+import numpy as np
+
+try:
+    from src.crowd.csrnet_runtime import preprocess_bgr
+except ImportError:  # run as a script from src/crowd
+    from csrnet_runtime import preprocess_bgr
+
+DOWNSAMPLE = 8  # CSRNet density maps are 1/8 of the input size
+
+
+def load_zones(path):
+    """{camera_key: {zone_name: [[x, y], ...]}} from a JSON file; camera keys are strings."""
+    if not path:
+        return {}
+    with open(path) as f:
+        return {str(k): v for k, v in json.load(f).items()}
+
+
+def _align(v):
+    return int(v) // DOWNSAMPLE * DOWNSAMPLE
+
+
+def _axis_starts(lo, hi, length, tile, stride):
+    """Tile start offsets covering [lo, hi) of an axis of the given length."""
+    if hi - lo <= tile:
+        return [max(0, min(lo, length - tile))]
+    starts = list(range(lo, hi - tile, stride))
+    starts.append(hi - tile)
+    return starts
+
+
+def _ramp(n, overlap):
+    if overlap <= 0:
+        return np.ones(n, dtype=np.float32)
+    x = np.arange(n, dtype=np.float32) + 0.5
+    return np.clip(np.minimum(x, n - x) / overlap, 1e-3, 1.0)
+
+
+class TilePlan:
+    """Tile layout, blend weights and zone masks for one frame size + zone set (cached)."""
+
+    def __init__(self, shape, zones, tile_size, overlap):
+        h, w = shape
+        dh, dw = h // DOWNSAMPLE, w // DOWNSAMPLE
+        self.shape = shape
+        self.zone_names = list(zones)
+        # Zone masks at density resolution, as fractional pixel coverage
+        self.zone_masks = []
+        for name in self.zone_names:
+            pts = np.round(np.asarray(zones[name], dtype=np.float64) * [w, h]).astype(np.int32)
+            full = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(full, [pts], 1)
+            self.zone_masks.append(cv2.resize(full.astype(np.float32), (dw, dh), interpolation=cv2.INTER_AREA))
+        if self.zone_masks:
+            self.union = np.clip(np.sum(self.zone_masks, axis=0), 0.0, 1.0)
+        else:
+            self.union = None
+
+        th = min(_align(tile_size), h) if tile_size else h
+        tw = min(_align(tile_size), w) if tile_size else w
+        self.tile_hw = (th, tw)
+        ov = _align(overlap)
+        if self.union is not None and self.union.any():
+            ys, xs = np.nonzero(self.union)
+            y0, y1 = ys.min() * DOWNSAMPLE, (ys.max() + 1) * DOWNSAMPLE
+            x0, x1 = xs.min() * DOWNSAMPLE, (xs.max() + 1) * DOWNSAMPLE
+        else:
+            y0, y1, x0, x1 = 0, h, 0, w
+        self.tiles = []
+        for sy in _axis_starts(y0, y1, h, th, max(DOWNSAMPLE, th - ov)):
+            for sx in _axis_starts(x0, x1, w, tw, max(DOWNSAMPLE, tw - ov)):
+                region = None if self.union is None else self.union[sy // DOWNSAMPLE:(sy + th) // DOWNSAMPLE,
+                                                                    sx // DOWNSAMPLE:(sx + tw) // DOWNSAMPLE]
+                if region is None or region.any():
+                    self.tiles.append((sy, sx))
+
+        self.weight = np.outer(_ramp(th // DOWNSAMPLE, ov // DOWNSAMPLE), _ramp(tw // DOWNSAMPLE, ov // DOWNSAMPLE))
+        wsum = np.zeros((dh, dw), dtype=np.float32)
+        for sy, sx in self.tiles:
+            wsum[self.density_slice(sy, sx)] += self.weight
+        self.inv_wsum = np.where(wsum > 0, 1.0 / np.maximum(wsum, 1e-12), 0.0).astype(np.float32)
+
+    def density_slice(self, sy, sx):
+        th, tw = self.tile_hw
+        return (slice(sy // DOWNSAMPLE, (sy + th) // DOWNSAMPLE), slice(sx // DOWNSAMPLE, (sx + tw) // DOWNSAMPLE))
+
+    @property
+    def coverage(self):
+        """Fraction of the frame's pixels that are sent through CSRNet."""
+        th, tw = self.tile_hw
+        return len(self.tiles) * th * tw / float(self.shape[0] * self.shape[1])
+
+
+class TiledDensityEstimator:
+    """
+    model: callable CSRNet (e.g. CSRNetRunner) mapping (n, 3, h, w) -> (n, 1, h/8, w/8).
+    tile_size: tile side in (rescaled) frame pixels, or None for one whole-frame tile.
+    input_size: (w, h) to resize frames to before tiling (legacy 640x360 mode), or None.
+    scale: resize factor applied when input_size is None (e.g. 0.5 for 4K -> 1080p).
+    gate: optional change_gate.ChangeGate; with per-camera keys, unchanged tiles reuse
+    their cached density and static frames skip CSRNet entirely.
+    """
+
+    def __init__(self, model, tile_size=512, overlap=64, input_size=None, scale=1.0, max_batch=8, device="cpu",
+                 gate=None):
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.input_size = tuple(input_size) if input_size else None
+        self.scale = scale
+        self.max_batch = max_batch
+        self.device = device
+        self.gate = gate
+        self._plans = {}
+
+    def prepare(self, frame):
+        """Rescaled frame cropped to a multiple of 8 pixels."""
+        if self.input_size:
+            frame = cv2.resize(frame, self.input_size)  # same as the original 640x360 path
+        elif self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        h, w = frame.shape[:2]
+        return frame[:_align(h), :_align(w)]
+
+    def plan(self, shape, zones=None):
+        zones = zones or {}
+        key = (tuple(shape), json.dumps(zones, sort_keys=True))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = TilePlan(shape, zones, self.tile_size, self.overlap)
+        return plan
+
+    def estimate(self, frames, zones_list=None, keys=None):
+        """
+        BGR frames (any sizes) and optional per-frame zone dicts ->
+        one dict per frame: {'density': (h/8, w/8) float32, 'count': float, 'zones': {name: count},
+        'computed_tiles': int}. Tiles of all frames share batches.
+        keys: per-frame camera keys for the change gate (if one is set); frames
+        without a key are always fully computed.
+        """
+        zones_list = zones_list or [None] * len(frames)
+        keys = keys or [None] * len(frames)
+        prepared = [self.prepare(f) for f in frames]
+        plans = [self.plan(f.shape[:2], z) for f, z in zip(prepared, zones_list)]
+
+        # Tiles to compute per frame: all, or only the changed/stale ones
+        selections = []
+        for frame, plan, key in zip(prepared, plans, keys):
+            if self.gate is not None and key is not None:
+                selections.append(self.gate.select(key, plan, frame))
+            else:
+                selections.append((None, list(range(len(plan.tiles))), None))
+
+        # Group tiles by size so each batch stacks same-shape crops
+        jobs = {}
+        for fi, (frame, plan) in enumerate(zip(prepared, plans)):
+            th, tw = plan.tile_hw
+            for ti in selections[fi][1]:
+                sy, sx = plan.tiles[ti]
+                jobs.setdefault((th, tw), []).append((fi, ti, frame[sy:sy + th, sx:sx + tw]))
+        outputs = [{} for _ in frames]
+        for group in jobs.values():
+            for s in range(0, len(group), self.max_batch):
+                chunk = group[s:s + self.max_batch]
+                out = self.model(preprocess_bgr([c[2] for c in chunk], self.device))
+                dens = out[:, 0].cpu().numpy()
+                for (fi, ti, _), d in zip(chunk, dens):
+                    outputs[fi][ti] = d
+
+        results = []
+        for fi, plan in enumerate(plans):
+            cache, todo, thumb = selections[fi]
+            tile_density = dict(outputs[fi])
+            if cache is not None:
+                self.gate.commit(keys[fi], cache, todo, thumb, [outputs[fi][ti] for ti in todo])
+                if not todo and cache.result is not None:
+                    results.append(dict(cache.result, computed_tiles=0))
+                    continue
+                tile_density = dict(enumerate(cache.densities))
+            acc = np.zeros(plan.inv_wsum.shape, dtype=np.float32)
+            for ti, d in tile_density.items():
+                acc[plan.density_slice(*plan.tiles[ti])] += d * plan.weight
+            density = acc * plan.inv_wsum
+            zone_counts = {name: float((density * m).sum()) for name, m in zip(plan.zone_names, plan.zone_masks)}
+            count = float((density * plan.union).sum()) if plan.union is not None else float(density.sum())
+            result = {"density": density, "count": count, "zones": zone_counts, "computed_tiles": len(todo)}
+            if cache is not None:
+                cache.result = result
+            results.append(result)
+        return results
@@ -0,0 +1,101 @@
+# src/detection/detector_export.py
+"""
+One-time export of the YOLOv8-Face weights to ONNX / OpenVINO for CPU inference.
+
+Artifacts are cached next to the weights under a name keyed by the weights
+hash, imgsz and opset, e.g. yolov8n-face_3f2a9c1e_640_op18.onnx, so a later
+start (or another detection worker) reuses them and a changed .pt triggers a
+fresh export.
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+
+def weights_hash(path, length=8, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+def cached_export_path(model_path, backend, imgsz=640, opset=18):
+    """Path of the cached artifact: a .onnx file, or an *_openvino_model directory."""
+    p = Path(model_path)
+    stem = f"{p.stem}_{weights_hash(p)}_{imgsz}_op{opset}"
+    if backend == 'onnx':
+        return p.with_name(stem + '.onnx')
+    if backend == 'openvino':
+        return p.with_name(stem + '_openvino_model')
+    raise ValueError(f"No export for backend: {backend}")
+
+
+def cached_export(model, model_path, backend, imgsz=640, opset=18):
+    """
+    Returns the cached ONNX/OpenVINO artifact for model_path, exporting it first
+    if needed. model is the loaded YOLO(model_path). Raises on export failure.
+    """
+    target = cached_export_path(model_path, backend, imgsz, opset)
+    if target.exists():
+        return target
+    print(f"[INFO] Exporting {model_path} to {backend} (imgsz={imgsz}, opset={opset}), one-time...")
+    # Dynamic axes so the batched detect_batch() calls are not pinned to batch 1
+    files = model.export(format=backend, imgsz=imgsz, opset=opset, dynamic=True, simplify=False)
+    if isinstance(files, (str, Path)):  # pip ultralytics returns the artifact path itself
+        files = [files]
+    # The exporter logs failures and returns whatever it did write (an OpenVINO
+    # export that fails after its ONNX step still returns the .onnx)
+    suffix = '.onnx' if backend == 'onnx' else '_openvino_model'
+    exported = next((Path(f) for f in files or [] if str(f).rstrip('/\\').endswith(suffix)), None)
+    intermediate = Path(model_path).with_suffix('.onnx')
+    try:
+        if exported is None or not exported.exists():
+            raise RuntimeError(f"{backend} export of {model_path} produced no artifact")
+        if backend == 'onnx':
+            # Re-save as a single self-contained file (newer torch exporters write external
+            # .onnx.data that would not survive the rename), then move it in atomically
+            import onnx
+            tmp = target.with_name(target.name + '.tmp')
+            onnx.save(onnx.load(str(exported)), str(tmp))
+            os.replace(tmp, target)
+        elif target.exists():
+            shutil.rmtree(exported, ignore_errors=True)
+        else:
+            os.replace(exported, target)
+    finally:
+        # The exporter writes <weights>.onnx (also the intermediate of the OpenVINO export)
+        for f in (intermediate, intermediate.with_name(intermediate.name + '.data')):
+            f.unlink(missing_ok=True)
+    print(f"[INFO] Cached {backend} detector at {target}")
+    return target
+
+
+def set_runtime_threads(yolo, artifact, threads):
+    """
+    Rebuilds the ONNX Runtime session / OpenVINO compiled model behind an exported
+    pip-ultralytics YOLO (after its first predict) with `threads` intra-op threads.
+    Returns False if the runtime exposes neither.
+    """
+    backend = yolo.predictor.model
+    backend = getattr(backend, 'backend', backend)  # AutoBackend wraps a per-format backend in ultralytics 8.4+
+    if getattr(backend, 'session', None) is not None:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = int(threads)
+        options.inter_op_num_threads = 1
+        backend.session = onnxruntime.InferenceSession(str(artifact), options,
+                                                       providers=backend.session.get_providers())
+        return True
+    if getattr(backend, 'compile_model', None) is not None:
+        import openvino as ov
+        xml = next(Path(artifact).glob('*.xml'))
+        config = dict(getattr(backend.compile_model, 'keywords', {}).get('config', {}))
+        config['INFERENCE_NUM_THREADS'] = int(threads)
+        backend.ov_compiled_model = backend.compile_model(ov.Core().read_model(str(xml)), config=config)
+        return True
+    return False
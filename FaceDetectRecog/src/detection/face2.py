@@ -6,24 +6,81 @@ import cv2
 import torch
 import os
 import sys
+import threading
+import numpy as np
 from ultralytics import YOLO
 
+from src.detection.detector_export import BACKENDS, cached_export, set_runtime_threads
+
+LANDMARK_KEYS = ('left_eye', 'right_eye', 'nose', 'left_mouth', 'right_mouth')
+# Columns of the (N, 15) float32 arrays from detect_batch(..., return_arrays=True)
+DET_COLUMNS = ('x1', 'y1', 'x2', 'y2', 'conf') + tuple(f"{k}_{c}" for k in LANDMARK_KEYS for c in ('x', 'y'))
+
 class FaceDetector:
     """
     Implements face detection using the YOLOv8-Face model.
     This class is designed to be imported into other scripts.
     """
-    def __init__(self, model_path="yolov8n-face.pt", conf_thresh=0.3, device=None):
+    def __init__(self, model_path="yolov8n-face.pt", conf_thresh=0.3, device=None,
+                 backend="pytorch", imgsz=640, opset=18, cpu_threads=None):
+        """
+        backend: 'pytorch' runs the .pt directly; 'onnx' / 'openvino' export it once
+        (cached next to the weights, see detector_export) and run the artifact on the
+        CPU with cpu_threads intra-op threads. If the export or the runtime is
+        unavailable, the detector falls back to PyTorch.
+
+        The ultralytics predictor is built once (on a blank frame) and reused: each call
+        runs its preprocess / inference / postprocess directly, without the per-call
+        source setup, dataset, callbacks and logging of YOLO.__call__. Landmarks are
+        kept, since postprocess is the model's own (pose) one.
+
+        One detector may be shared by several threads (e.g. Detection and DBUpdater);
+        predictions are serialised by a lock since the predictor keeps per-call state.
+        """
         self.conf_thresh = conf_thresh
+        self.imgsz = imgsz
         self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"[INFO] Initializing YOLOv8-Face Detector on device: {self.device}")
-        
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown detector backend: {backend}")
+
         if not os.path.exists(model_path):
             print(f"[ERROR] Model file not found at: {model_path}", file=sys.stderr)
             sys.exit(1)
-            
+
         self.model = YOLO(model_path)
-        self.model.to(self.device)
+        self._lock = threading.Lock()
+        self.backend = "pytorch"
+        self.runtime = None  # exported model (onnx/openvino), run through its own YOLO
+        if backend != "pytorch":
+            try:
+                self.runtime = self._load_exported(model_path, backend, opset, cpu_threads)
+                self.backend = backend
+                self.device = "cpu"
+            except Exception as e:
+                print(f"[WARN] {backend} detector unavailable ({e}); falling back to PyTorch", file=sys.stderr)
+        if self.runtime is None:
+            self.model.to(self.device)
+            self._warmup(self.model, device=self.device)
+        self.predictor = (self.runtime or self.model).predictor
+        print(f"[INFO] Initializing YOLOv8-Face Detector on device: {self.device} (backend: {self.backend})")
+
+    def _warmup(self, yolo, **kwargs):
+        """
+        One prediction on a blank frame: builds yolo.predictor (model, imgsz, session) for
+        reuse, with NMS at the detector's conf_thresh.
+        """
+        blank = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        yolo(blank, verbose=False, imgsz=self.imgsz, conf=self.conf_thresh, **kwargs)
+
+    def _load_exported(self, model_path, backend, opset, cpu_threads):
+        artifact = cached_export(self.model, model_path, backend, self.imgsz, opset)
+        threads = cpu_threads or torch.get_num_threads()
+        # Native ultralytics loading of the .onnx file / *_openvino_model directory
+        runtime = YOLO(str(artifact), task=self.model.task)
+        self._warmup(runtime, device="cpu")
+        if not set_runtime_threads(runtime, artifact, threads):
+            print(f"[WARN] Could not set {backend} detector threads; using the runtime default", file=sys.stderr)
+        return runtime
 
     def detect(self, frame):
         """
@@ -33,41 +90,73 @@ class FaceDetector:
             A list of tuples, where each tuple contains:
             (x1, y1, x2, y2, confidence, landmarks_dict)
         """
-        results = self.model(frame, verbose=True, imgsz=640)[0]
-        
-        detections = []
-        boxes = results.boxes
-        keypoints = results.keypoints
+        results = self._predict([frame])[0]
+        return self.to_tuples(self._extract_arrays([results])[0])
 
-        # Iterate through each detected box
-        for i in range(len(boxes)):
-            box = boxes[i]
-            conf = float(box.conf[0])
+    def detect_batch(self, frames, return_arrays=False):
+        """
+        Runs detection on a list of BGR frames in a single forward pass.
 
-            if conf < self.conf_thresh:
-                continue
+        Returns:
+            One detection list per frame, in the same format as detect().
+            With return_arrays=True, (lists, arrays) where arrays holds one
+            (N, 15) float32 array per frame (see DET_COLUMNS).
+        """
+        if len(frames) == 0:
+            return ([], []) if return_arrays else []
+        results = self._predict(list(frames))
+        arrays = self._extract_arrays(results)
+        lists = [self.to_tuples(a) for a in arrays]
+        return (lists, arrays) if return_arrays else lists
 
-            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-            
-            landmarks = {}
-            # Safely check for corresponding keypoints
-            if keypoints is not None and len(keypoints) > i:
-                kpts = keypoints[i]
-                if len(kpts.xy[0]) == 5:
-                    lm_coords = kpts.xy[0].cpu().numpy().astype(int)
-                    landmarks = {
-                        'left_eye': tuple(lm_coords[0]),
-                        'right_eye': tuple(lm_coords[1]),
-                        'nose': tuple(lm_coords[2]),
-                        'left_mouth': tuple(lm_coords[3]),
-                        'right_mouth': tuple(lm_coords[4])
-                    }
-            
-            # Append the detection
+    def _predict(self, frames):
+        """Results of a list of BGR frames from the reused predictor's own pre/postprocessing."""
+        p = self.predictor
+        with self._lock, torch.inference_mode():
+            # construct_results reads the image paths from the current batch
+            p.batch = ([""] * len(frames), frames, [""] * len(frames))
+            im = p.preprocess(frames)
+            return p.postprocess(p.inference(im), im, frames)
+
+    def _extract_arrays(self, results):
+        """
+        Packs boxes, confidences and keypoints of every result into (N, 15) float32
+        arrays with one device->host copy for the whole batch (instead of one
+        sync per box). Missing landmarks are NaN.
+        """
+        packed = []
+        counts = []
+        for r in results:
+            boxes = r.boxes.data  # (N, 6): x1, y1, x2, y2, conf, cls
+            n = boxes.shape[0]
+            lm = torch.full((n, 10), float('nan'), dtype=boxes.dtype, device=boxes.device)
+            kpts = getattr(r, 'keypoints', None)
+            if kpts is not None and n and kpts.xy.shape[0] == n and kpts.xy.shape[1] == 5:
+                lm = kpts.xy.reshape(n, 10).to(boxes.dtype)
+            packed.append(torch.cat([boxes[:, :5], lm], dim=1))
+            counts.append(n)
+        if not packed:
+            return []
+        allp = torch.cat(packed).float().cpu().numpy()
+        arrays = []
+        for part in np.split(allp, np.cumsum(counts)[:-1]):
+            arrays.append(np.ascontiguousarray(part[part[:, 4] >= self.conf_thresh]))
+        return arrays
+
+    @staticmethod
+    def to_tuples(arr):
+        """(N, 15) detection array -> legacy [(x1, y1, x2, y2, conf, landmarks_dict), ...]."""
+        if len(arr) == 0:
+            return []
+        boxes = arr[:, :4].astype(int).tolist()
+        confs = arr[:, 4].tolist()
+        has_lm = ~np.isnan(arr[:, 5:]).any(axis=1)
+        lms = np.nan_to_num(arr[:, 5:]).astype(int).reshape(-1, 5, 2).tolist()
+        detections = []
+        for (x1, y1, x2, y2), conf, ok, pts in zip(boxes, confs, has_lm, lms):
+            landmarks = {k: tuple(p) for k, p in zip(LANDMARK_KEYS, pts)} if ok else {}
             detections.append((x1, y1, x2, y2, conf, landmarks))
-                
         return detections
-  
 
 
 # # demo_face_detection.py
@@ -0,0 +1,89 @@
+# src/detection/frame_sampler.py
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class AdaptiveSampler:
+    """
+    Decides which captured frames are sent to face detection.
+
+    The detection interval (in frames) shrinks towards min_interval while the
+    scene is active (motion, faces seen recently, live tracks) and grows
+    towards max_interval on static scenes. When the detection queue is
+    saturated the interval is doubled so capture backs off instead of
+    flooding the detector. Motion is the mean absolute difference of
+    consecutive frames downscaled to a tiny grayscale thumbnail.
+    """
+    def __init__(self, base_interval=10, min_interval=2, max_interval=30, motion_thresh=4.0,
+                 face_hold=2.0, backlog_high=0.75, thumb_size=(64, 36), fps_window=10.0):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.motion_thresh = motion_thresh
+        self.face_hold = face_hold
+        self.backlog_high = backlog_high
+        self.thumb_size = thumb_size
+        self.fps_window = fps_window
+
+        self.interval = float(base_interval)
+        self.frames_since = 0
+        self.prev_thumb = None
+        self.motion = 0.0
+        self.last_face_time = 0.0
+        self.active_tracks = 0
+        self.detect_times = deque()
+
+    def measure_motion(self, frame):
+        thumb = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        thumb = thumb.astype(np.int16)
+        motion = 0.0 if self.prev_thumb is None else float(np.abs(thumb - self.prev_thumb).mean())
+        self.prev_thumb = thumb
+        return motion
+
+    def note_faces(self, num_faces, num_tracks=None):
+        """Feedback from detection/tracking for this camera."""
+        if num_faces > 0:
+            self.last_face_time = time.monotonic()
+        if num_tracks is not None:
+            self.active_tracks = num_tracks
+
+    def should_detect(self, frame, backlog=0.0):
+        """
+        Call once per captured frame. backlog: detection queue fill ratio (0..1).
+        Returns True if this frame should go to detection.
+        """
+        self.frames_since += 1
+        self.motion = self.measure_motion(frame)
+
+        now = time.monotonic()
+        active = (self.motion >= self.motion_thresh
+                  or now - self.last_face_time < self.face_hold
+                  or self.active_tracks > 0)
+        if active:
+            self.interval = float(self.min_interval)
+        else:
+            # Static scene: relax gradually back up to the ceiling
+            self.interval = min(self.max_interval, max(self.interval, self.base_interval) * 1.05)
+
+        interval = self.interval
+        if backlog >= self.backlog_high:
+            interval = min(self.max_interval, interval * 2)
+
+        if self.frames_since < interval:
+            return False
+        self.frames_since = 0
+        self.detect_times.append(now)
+        return True
+
+    @property
+    def effective_fps(self):
+        """Frames sent to detection per second over the last fps_window seconds."""
+        now = time.monotonic()
+        while self.detect_times and now - self.detect_times[0] > self.fps_window:
+            self.detect_times.popleft()
+        return len(self.detect_times) / self.fps_window
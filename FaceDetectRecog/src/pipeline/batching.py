@@ -0,0 +1,33 @@
+# src/pipeline/batching.py
+"""
+Dynamic micro-batching shared by the pipeline stages: the detection thread
+(frame queue), EmbeddingEngine (crop queue) and ShmRing (shared-memory slots).
+"""
+import time
+from queue import Empty
+
+# Floor for the polls after the deadline: a zero timeout can miss items that are
+# still in a multiprocessing queue's pipe
+MIN_POLL = 0.001
+
+
+def collect_batch(source, max_items, max_wait, timeout=1.0):
+    """
+    Blocks up to timeout for the first item, then keeps draining source until
+    max_items are gathered or max_wait seconds have passed (items already
+    waiting are still taken after the deadline).
+    source: anything with get(timeout=...) raising queue.Empty (Queue, ShmRing).
+    Returns a (possibly empty) list of items.
+    """
+    try:
+        items = [source.get(timeout=timeout)]
+    except Empty:
+        return []
+    deadline = time.monotonic() + max_wait
+    while len(items) < max_items:
+        remaining = deadline - time.monotonic()
+        try:
+            items.append(source.get(timeout=max(remaining, MIN_POLL)))
+        except Empty:
+            break
+    return items
@@ -0,0 +1,66 @@
+# src/pipeline/bounded_queue.py
+from queue import Queue, Full
+
+DROP_POLICIES = ("block", "drop-new", "drop-old")
+
+
+class BoundedQueue(Queue):
+    """
+    queue.Queue with an overflow policy and counters.
+
+    block:    put() waits up to block_timeout (forever if None), then drops.
+    drop-new: put() on a full queue discards the incoming item.
+    drop-old: put() on a full queue evicts the oldest item to make room,
+              so consumers always see the freshest data.
+
+    put() returns True if the item was enqueued. dropped counts discarded
+    items (incoming or evicted); high_water is the largest size seen.
+    """
+    def __init__(self, maxsize, policy="block", name="", block_timeout=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy} (expected one of {DROP_POLICIES})")
+        super().__init__(maxsize=maxsize)
+        self.policy = policy
+        self.name = name
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.high_water = 0
+
+    def _put(self, item):
+        super()._put(item)
+        n = self._qsize()
+        if n > self.high_water:
+            self.high_water = n
+
+    def put(self, item, block=True, timeout=None):
+        if self.policy == "drop-old":
+            with self.not_full:
+                if 0 < self.maxsize <= self._qsize():
+                    self._get()
+                    # The evicted item will never be task_done()'d
+                    self.unfinished_tasks -= 1
+                    self.dropped += 1
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            return True
+
+        if self.policy == "drop-new":
+            block = False
+        elif timeout is None:
+            timeout = self.block_timeout
+        try:
+            super().put(item, block=block, timeout=timeout)
+            return True
+        except Full:
+            with self.mutex:
+                self.dropped += 1
+            return False
+
+    def stats(self):
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "high_water": self.high_water,
+            "dropped": self.dropped,
+        }
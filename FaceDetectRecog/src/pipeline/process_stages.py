@@ -0,0 +1,141 @@
+# src/pipeline/process_stages.py
+"""
+Worker processes for the multiprocessing execution mode of pipeline_advanced.
+
+Each worker loads its own model and talks to the main process through
+ShmRing buffers (frames, face crops) and a small result Queue (embeddings),
+so detection and embedding run outside the main interpreter's GIL.
+These functions live in a plain module so 'spawn' children can import them
+without re-running the pipeline script.
+"""
+import time
+import logging
+from queue import Full
+
+import cv2
+import numpy as np
+import torch
+
+
+def _setup_worker(name, torch_threads):
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s [%(levelname)s] [%(processName)s] %(message)s')
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    return logging.getLogger(name)
+
+
+def fit_to_slot(image, slot_bytes):
+    # Downscale images that would not fit a ring slot (the embedder resizes crops to 160 anyway)
+    if image.nbytes <= slot_bytes:
+        return image
+    scale = (slot_bytes / image.nbytes) ** 0.5 * 0.99
+    h, w = image.shape[:2]
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def detection_worker(frame_ring, crop_ring, result_queue, stop_event, conf_thresh, max_batch, max_wait,
+                     torch_threads=1, tracking=None, align=False, backend='pytorch'):
+    """
+    Frames (frame_ring) -> face crops (crop_ring).
+    Frame meta: (camera_id, frame_id). Crop meta: (crop_id, camera_id, frame_id, track_id, quality).
+    Per batch, ("faces", [(camera_id, n_detections, n_tracks), ...]) goes to result_queue
+    for the cameras' adaptive samplers (n_tracks is None without tracking).
+    tracking: None to crop every detection, or a dict with the Tracker arguments plus
+    refresh_interval/quality_gain; one tracker is kept per camera this worker serves.
+    align: send landmark-aligned 160x160 faces instead of box crops.
+    backend: FaceDetector backend; onnx/openvino load the artifact cached by the parent.
+    """
+    logger = _setup_worker("Pipeline.Detection", torch_threads)
+    from src.detection.face2 import FaceDetector
+    from src.tracking.deep_sort import Tracker, select_for_embedding
+    from src.tracking.feature_bank import clip_crop, face_quality
+    from src.recognition.face_align import align_faces
+    detector = FaceDetector(conf_thresh=conf_thresh, device='cpu', backend=backend, cpu_threads=torch_threads)
+    trackers = {}
+    logger.info("Detection worker ready.")
+
+    while not stop_event.is_set():
+        batch = frame_ring.get_many(max_batch, max_wait, timeout=1)
+        if not batch:
+            continue
+        try:
+            all_detections, all_arrays = detector.detect_batch([view for _, view, _ in batch], return_arrays=True)
+            now = time.monotonic()
+            face_counts = []
+            for (_, frame, (camera_id, frame_id)), detections, det_array in zip(batch, all_detections, all_arrays):
+                crops = [clip_crop(frame, det) for det in detections]
+                qualities = None
+                if tracking is None:
+                    selected = [(i, None) for i in range(len(detections))]
+                    face_counts.append((camera_id, len(detections), None))
+                else:
+                    qualities = [face_quality(det, c) if c is not None else 0.0
+                                 for det, c in zip(detections, crops)]
+                    if camera_id not in trackers:
+                        trackers[camera_id] = Tracker(tracking['max_age'], tracking['n_init'],
+                                                      tracking['max_iou_distance'])
+                    tracks = trackers[camera_id].update(det_array, frame)
+                    selected = select_for_embedding(tracks, detections, now, tracking['refresh_interval'],
+                                                    tracking['quality_gain'], qualities)
+                    face_counts.append((camera_id, len(detections), len(trackers[camera_id].tracks)))
+                selected = [(i, track_id) for i, track_id in selected if crops[i] is not None]
+                if align:
+                    faces = align_faces(frame, [detections[i] for i, _ in selected], 160)
+                else:
+                    faces = [crops[i] for i, _ in selected]
+                for (i, track_id), face in zip(selected, faces):
+                    crop = np.ascontiguousarray(fit_to_slot(face, crop_ring.slot_bytes))
+                    crop_id = f"face_c{camera_id}_{frame_id}_{i}"
+                    quality = qualities[i] if qualities is not None else None
+                    meta = (crop_id, camera_id, frame_id, track_id, quality)
+                    if not crop_ring.put(crop, meta, timeout=1):
+                        logger.warning("Crop ring full, dropping face crop.")
+            try:
+                result_queue.put_nowait(("faces", face_counts))
+            except Full:
+                pass  # sampler feedback is advisory; the next batch sends fresh counts
+        except Exception as e:
+            logger.error(f"Error in detection worker: {e}")
+        finally:
+            for slot, _, _ in batch:
+                frame_ring.release(slot)
+
+
+def embedding_worker(crop_ring, result_queue, stop_event, max_batch, max_wait, input_size=160,
+                     pretrained='vggface2', torch_threads=1, runtime='eager', quantize=None,
+                     quant_state=None):
+    """
+    Face crops (crop_ring) -> ("emb", emb, crop_slot, crop_shape, crop_id, camera_id, frame_id, track_id, quality)
+    on result_queue.
+    The crop slot is released by the consumer of result_queue.
+    runtime: embedder runtime (eager/onnx/torchscript); exported models come from the parent's cache.
+    quantize: None, 'dynamic' or 'static' INT8 embedder; static loads quant_state, the
+    parent's calibrated state file (dynamic if the parent had nothing to calibrate on),
+    so both processes embed with the same INT8 scales.
+    """
+    logger = _setup_worker("Pipeline.Embedding", torch_threads)
+    from src.recognition.face_recog_core import load_model
+    from src.recognition.embedding_engine import EmbeddingEngine
+    model = load_model(device='cpu', pretrained=pretrained, runtime=runtime, threads=torch_threads,
+                       quantize=quantize, calib_dir=None, quant_state=quant_state)
+    engine = EmbeddingEngine(model, 'cpu',
+                             input_size=input_size, max_batch=max_batch, max_wait=max_wait)
+    logger.info("Embedding worker ready.")
+
+    while not stop_event.is_set():
+        batch = crop_ring.get_many(max_batch, max_wait, timeout=1)
+        if not batch:
+            continue
+        try:
+            embs = engine.embed([view for _, view, _ in batch])
+        except Exception as e:
+            logger.error(f"Error in embedding worker: {e}")
+            for slot, _, _ in batch:
+                crop_ring.release(slot)
+            continue
+        for (slot, view, meta), emb in zip(batch, embs):
+            try:
+                result_queue.put(("emb", emb, slot, view.shape) + tuple(meta), timeout=1)
+            except Full:
+                crop_ring.release(slot)
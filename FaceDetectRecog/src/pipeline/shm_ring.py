@@ -0,0 +1,102 @@
+# src/pipeline/shm_ring.py
+"""
+Shared-memory ring buffer for passing numpy images between processes.
+
+One multiprocessing.shared_memory block is split into fixed-size slots.
+The producer writes an image straight into a free slot; only the slot
+number, shape and a small metadata tuple travel through a Queue, and the
+consumer maps the slot as a numpy view, so large frames are never pickled.
+The consumer hands the slot back with release() once it is done with it.
+"""
+from queue import Empty, Full
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.pipeline.batching import collect_batch
+
+
+class ShmRing:
+    def __init__(self, ctx, n_slots, slot_bytes):
+        self.n_slots = n_slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * slot_bytes)
+        self.name = self.shm.name
+        self.owner = True
+        self.dropped = 0  # producer-side count of dropped/evicted items
+        self.free = ctx.Queue()
+        self.ready = ctx.Queue()
+        for i in range(n_slots):
+            self.free.put(i)
+
+    # Only the block name and queues are pickled; children re-attach by name
+    def __getstate__(self):
+        return {
+            'n_slots': self.n_slots,
+            'slot_bytes': self.slot_bytes,
+            'name': self.name,
+            'free': self.free,
+            'ready': self.ready,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dropped = 0
+        self.shm = shared_memory.SharedMemory(name=self.name)
+        self.owner = False
+
+    def view(self, slot, shape, dtype=np.uint8):
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def fits(self, array):
+        return array.nbytes <= self.slot_bytes
+
+    def put(self, array, meta=None, timeout=None, evict_oldest=False):
+        """
+        Copies array into a free slot and publishes it. Returns False if no slot
+        became free within timeout (the item is dropped). With evict_oldest, a
+        full ring instead reuses the slot of the oldest unconsumed item.
+        """
+        if not self.fits(array):
+            raise ValueError(f"Array of {array.nbytes} bytes does not fit a {self.slot_bytes}-byte slot")
+        try:
+            slot = self.free.get(timeout=timeout) if timeout else self.free.get_nowait()
+        except Empty:
+            slot = None
+        if slot is None and evict_oldest:
+            try:
+                slot = self.ready.get_nowait()[0]
+            except Empty:
+                pass
+            self.dropped += 1
+        if slot is None:
+            if not evict_oldest:
+                self.dropped += 1
+            return False
+        self.view(slot, array.shape, array.dtype)[...] = array
+        try:
+            self.ready.put((slot, array.shape, array.dtype.str, meta), timeout=timeout)
+        except Full:
+            self.release(slot)
+            return False
+        return True
+
+    def get(self, timeout=None):
+        """
+        Returns (slot, view, meta); raises queue.Empty on timeout.
+        The view stays valid until release(slot).
+        """
+        slot, shape, dtype, meta = self.ready.get(timeout=timeout)
+        return slot, self.view(slot, shape, np.dtype(dtype)), meta
+
+    def get_many(self, max_items, max_wait, timeout=1.0):
+        """Blocks up to timeout for one item, then drains for up to max_wait seconds."""
+        return collect_batch(self, max_items, max_wait, timeout)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
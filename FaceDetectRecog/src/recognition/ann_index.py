@@ -0,0 +1,247 @@
+# src/recognition/ann_index.py
+"""
+Approximate nearest-neighbour backends for the reference embedding store.
+
+Both backends subclass ReferenceIndex, so match_query / match_queries work
+unchanged. Candidates are found approximately and the best `rerank` of them
+are re-scored exactly against the float32 matrix before top-k is returned.
+
+    ivf   - IVF-flat in NumPy: spherical k-means coarse quantiser, float16
+            inverted lists, `nprobe` lists scanned per query.
+    faiss - optional faiss HNSW adapter, `ef_search` controls the graph walk.
+
+Knobs: larger nprobe / ef_search -> higher recall, higher latency.
+"""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from src.recognition.face_recog_core import ReferenceIndex
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+
+def ids_fingerprint(ids, matrix):
+    # Identifies the exact reference set an index was built from
+    h = hashlib.sha1()
+    h.update("\n".join(map(str, ids)).encode("utf-8"))
+    h.update(np.ascontiguousarray(matrix[:, :8]).tobytes())
+    return h.hexdigest()
+
+
+def _spherical_kmeans(X, nlist, n_iter=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(X @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, X)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        # Re-seed empty clusters from random points
+        if empty.any():
+            sums[empty] = X[rng.choice(len(X), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFFlatIndex(ReferenceIndex):
+    """
+    Inverted-file index over the normalised reference matrix.
+
+    merge() assigns new rows to the existing centroids; once the rows added and
+    dropped since training exceed retrain_drift * (rows trained on), the
+    centroids are retrained so the lists do not drift out of balance.
+    """
+    def __init__(self, embeddings, ids, nlist=None, nprobe=8, rerank=64, centroids=None, assign=None, normalized=False,
+                 trained_rows=None, churn=0, retrain_drift=0.5):
+        super().__init__(embeddings, ids, normalized=normalized)
+        n = len(self.ids)
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.retrain_drift = retrain_drift
+        # Rows the centroids were trained on, and rows added + dropped since
+        self.trained_rows = n if centroids is None or trained_rows is None else int(trained_rows)
+        self.churn = 0 if centroids is None else int(churn)
+        if centroids is None:
+            nlist = nlist or max(1, int(np.sqrt(n)))
+            nlist = min(nlist, max(n, 1))
+            train = self.matrix
+            if n > 64 * nlist:
+                rng = np.random.default_rng(0)
+                train = self.matrix[rng.choice(n, 64 * nlist, replace=False)]
+            centroids = _spherical_kmeans(train, nlist) if n else np.zeros((1, self.dim), np.float32)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        if assign is None:
+            assign = self._assign(self.matrix)
+        self.assign = np.asarray(assign, dtype=np.int32)
+        self._build_lists()
+
+    def _assign(self, X, chunk=65536):
+        out = np.empty(len(X), dtype=np.int32)
+        for s in range(0, len(X), chunk):
+            out[s:s + chunk] = np.argmax(X[s:s + chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def _build_lists(self):
+        order = np.argsort(self.assign, kind="stable")
+        counts = np.bincount(self.assign, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.list_ids = order.astype(np.int64)
+        # Candidate scan runs on a float16 copy laid out list-by-list
+        self.list_vectors = self.matrix[order].astype(np.float16)
+
+    def search(self, queries, topk=5):
+        Q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(Q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        Q = Q / norms
+
+        k = min(topk, len(self.ids))
+        out_idx = np.full((len(Q), k), -1, dtype=np.int64)
+        out_sim = np.full((len(Q), k), -np.inf, dtype=np.float32)
+        if k <= 0:
+            return out_idx, out_sim
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(Q @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        for qi, q in enumerate(Q):
+            spans = [np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probes[qi]]
+            rows = np.concatenate(spans)
+            if len(rows) == 0:
+                continue
+            approx = self.list_vectors[rows].astype(np.float32) @ q
+            r = min(max(self.rerank, k), len(rows))
+            top = np.argpartition(-approx, r - 1)[:r]
+            cand = self.list_ids[rows[top]]
+            # Exact re-rank against the float32 matrix
+            exact = self.matrix[cand] @ q
+            order = np.argsort(-exact)[:k]
+            out_idx[qi, :len(order)] = cand[order]
+            out_sim[qi, :len(order)] = exact[order]
+        return out_idx, out_sim
+
+    def merge(self, add_embeddings, add_ids, drop_ids=()):
+        keep, matrix, ids, added = self._merged_rows(add_embeddings, add_ids, drop_ids)
+        churn = self.churn + int((~keep).sum()) + len(added)
+        if churn > self.retrain_drift * max(self.trained_rows, 1):
+            # Too much has changed since training: retrain the coarse quantiser
+            return IVFFlatIndex(matrix, ids, nprobe=self.nprobe, rerank=self.rerank, normalized=True,
+                                retrain_drift=self.retrain_drift)
+        # New rows go to their nearest existing centroid
+        assign = np.concatenate([self.assign[keep], self._assign(added)])
+        return IVFFlatIndex(matrix, ids, nprobe=self.nprobe, rerank=self.rerank,
+                            centroids=self.centroids, assign=assign, normalized=True,
+                            trained_rows=self.trained_rows, churn=churn, retrain_drift=self.retrain_drift)
+
+    def save(self, path):
+        np.savez(path, kind="ivf", fingerprint=ids_fingerprint(self.ids, self.matrix),
+                 centroids=self.centroids, assign=self.assign, trained_rows=self.trained_rows, churn=self.churn)
+
+    @classmethod
+    def load(cls, path, embeddings, ids, nprobe=8, rerank=64, normalized=False):
+        data = np.load(path, allow_pickle=False)
+        base = ReferenceIndex(embeddings, ids, normalized=normalized)
+        if str(data["kind"]) != "ivf" or str(data["fingerprint"]) != ids_fingerprint(base.ids, base.matrix):
+            return None
+        # Indexes saved before drift tracking count as freshly trained
+        trained_rows = int(data["trained_rows"]) if "trained_rows" in data else len(base.ids)
+        churn = int(data["churn"]) if "churn" in data else 0
+        return cls(base.matrix, ids, nprobe=nprobe, rerank=rerank,
+                   centroids=data["centroids"], assign=data["assign"], normalized=True,
+                   trained_rows=trained_rows, churn=churn)
+
+
+class FaissHNSWIndex(ReferenceIndex):
+    """
+    faiss HNSW (inner product) adapter with exact re-rank. Requires faiss.
+    """
+    def __init__(self, embeddings, ids, M=32, ef_search=64, rerank=64, hnsw=None, normalized=False):
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss is not installed; use backend='ivf' or 'exact'.")
+        super().__init__(embeddings, ids, normalized=normalized)
+        self.rerank = rerank
+        if hnsw is None:
+            hnsw = faiss.IndexHNSWFlat(self.dim, M, faiss.METRIC_INNER_PRODUCT)
+            hnsw.add(self.matrix)
+        self.hnsw = hnsw
+        self.ef_search = ef_search
+
+    @property
+    def ef_search(self):
+        return self.hnsw.hnsw.efSearch
+
+    @ef_search.setter
+    def ef_search(self, value):
+        self.hnsw.hnsw.efSearch = int(value)
+
+    def search(self, queries, topk=5):
+        Q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(Q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        Q = np.ascontiguousarray(Q / norms)
+        k = min(topk, len(self.ids))
+        r = min(max(self.rerank, k), len(self.ids))
+        _, cand = self.hnsw.search(Q, r)
+        out_idx = np.full((len(Q), k), -1, dtype=np.int64)
+        out_sim = np.full((len(Q), k), -np.inf, dtype=np.float32)
+        for qi in range(len(Q)):
+            c = cand[qi][cand[qi] >= 0]
+            exact = self.matrix[c] @ Q[qi]
+            order = np.argsort(-exact)[:k]
+            out_idx[qi, :len(order)] = c[order]
+            out_sim[qi, :len(order)] = exact[order]
+        return out_idx, out_sim
+
+    def merge(self, add_embeddings, add_ids, drop_ids=()):
+        # HNSW graphs do not support deletion: re-insert the kept rows
+        _, matrix, ids, _ = self._merged_rows(add_embeddings, add_ids, drop_ids)
+        return FaissHNSWIndex(matrix, ids, ef_search=self.ef_search, rerank=self.rerank, normalized=True)
+
+    def save(self, path):
+        faiss.write_index(self.hnsw, str(path) + ".faiss")
+        np.savez(path, kind="faiss", fingerprint=ids_fingerprint(self.ids, self.matrix))
+
+    @classmethod
+    def load(cls, path, embeddings, ids, ef_search=64, rerank=64, normalized=False):
+        if not FAISS_AVAILABLE:
+            return None
+        data = np.load(path, allow_pickle=False)
+        base = ReferenceIndex(embeddings, ids, normalized=normalized)
+        if str(data["kind"]) != "faiss" or str(data["fingerprint"]) != ids_fingerprint(base.ids, base.matrix):
+            return None
+        hnsw = faiss.read_index(str(path) + ".faiss")
+        return cls(base.matrix, ids, ef_search=ef_search, rerank=rerank, hnsw=hnsw, normalized=True)
+
+
+def build_ann_index(embeddings, ids, backend="ivf", cache_path=None, nprobe=8, ef_search=64, rerank=64, normalized=False):
+    """
+    Builds (or reloads from cache_path, if it matches the reference set) an ANN index.
+    """
+    cls = {"ivf": IVFFlatIndex, "faiss": FaissHNSWIndex}.get(backend)
+    if cls is None:
+        raise ValueError(f"Unknown index backend: {backend}")
+    knob = {"nprobe": nprobe} if backend == "ivf" else {"ef_search": ef_search}
+
+    if cache_path is not None and Path(cache_path).exists():
+        try:
+            index = cls.load(cache_path, embeddings, ids, rerank=rerank, normalized=normalized, **knob)
+            if index is not None:
+                return index
+        except Exception as e:
+            print(f"Warning: could not reload ANN index from {cache_path}: {e}")
+
+    index = cls(embeddings, ids, rerank=rerank, normalized=normalized, **knob)
+    if cache_path is not None:
+        try:
+            index.save(cache_path)
+        except Exception as e:
+            print(f"Warning: could not persist ANN index to {cache_path}: {e}")
+    return index
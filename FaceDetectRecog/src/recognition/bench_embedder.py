@@ -0,0 +1,86 @@
+# bench_embedder.py
+"""
+Parity check and throughput benchmark of the embedder runtimes:
+eager InceptionResnetV1 vs. its TorchScript and ONNX Runtime exports.
+
+The exports are made from the same eager model into a temporary directory,
+so the check covers the export path itself. Exits non-zero if any runtime's
+embeddings drift below --min_cos cosine similarity from eager.
+
+    python -m src.recognition.bench_embedder --pretrained vggface2 --batch 32 --threads 4
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from src.recognition.embedder_export import OnnxEmbedder, export_onnx, export_torchscript
+from src.recognition.face_recog_core import InceptionResnetV1
+
+
+def l2n(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def run(model, x, batch):
+    outs = []
+    with torch.no_grad():
+        for s in range(0, len(x), batch):
+            outs.append(model(x[s:s + batch]).cpu().numpy())
+    return np.concatenate(outs)
+
+
+def throughput(model, x, batch, repeats):
+    run(model, x[:batch], batch)  # warm-up
+    best = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        run(model, x, batch)
+        best = min(best, time.perf_counter() - t0)
+    return len(x) / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pretrained', type=str, default='vggface2',
+                        help="vggface2, casia-webface, or none (random weights, offline)")
+    parser.add_argument('--n', type=int, default=128, help='Number of random face inputs')
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--input_size', type=int, default=160)
+    parser.add_argument('--threads', type=int, default=None, help='CPU threads (torch and onnxruntime)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--min_cos', type=float, default=0.999)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    pretrained = None if args.pretrained == 'none' else args.pretrained
+    eager = InceptionResnetV1(pretrained=pretrained).eval()
+    x = torch.from_numpy(np.random.default_rng(0).uniform(-1, 1, (args.n, 3, args.input_size, args.input_size))
+                         .astype(np.float32))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runtimes = {
+            'eager': eager,
+            'torchscript': torch.jit.load(str(export_torchscript(eager, Path(tmp) / 'm.torchscript.pt',
+                                                                 args.input_size))),
+            'onnx': OnnxEmbedder(export_onnx(eager, Path(tmp) / 'm.onnx', args.input_size), threads=args.threads),
+        }
+        ref = l2n(run(eager, x, args.batch))
+        ok = True
+        print(f"pretrained={args.pretrained} n={args.n} batch={args.batch} threads={torch.get_num_threads()}")
+        for name, model in runtimes.items():
+            cos = (l2n(run(model, x, args.batch)) * ref).sum(axis=1)
+            rate = throughput(model, x, args.batch, args.repeats)
+            passed = cos.min() > args.min_cos
+            ok &= bool(passed)
+            print(f"{name:12s} {rate:8.1f} faces/s   min cos vs eager {cos.min():.6f}  {'OK' if passed else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
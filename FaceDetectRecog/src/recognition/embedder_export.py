@@ -0,0 +1,130 @@
+# src/recognition/embedder_export.py
+"""
+ONNX / TorchScript export and runtime for the InceptionResnetV1 embedder.
+
+Exported models have a dynamic batch axis and are cached per `pretrained`
+choice, so later starts skip building the eager model (and the weight
+download). OnnxEmbedder is a drop-in replacement for the eager model:
+it takes the normalised (n, 3, 160, 160) tensor from BGRPreprocessor /
+make_transform and returns (n, 512) raw embeddings, so
+get_embedding_pytorch, get_embedding_bgr and EmbeddingEngine work unchanged.
+
+    python -m src.recognition.embedder_export --pretrained vggface2 --format onnx
+"""
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+RUNTIMES = ('eager', 'onnx', 'torchscript')
+CACHE_DIR = 'exported_models'
+ONNX_OPSET = 18
+
+
+def cached_model_path(pretrained='vggface2', fmt='onnx', cache_dir=CACHE_DIR, input_size=160):
+    suffix = {'onnx': f'_op{ONNX_OPSET}.onnx', 'torchscript': '.torchscript.pt'}[fmt]
+    return Path(cache_dir) / f"inception_resnet_v1_{pretrained}_{input_size}{suffix}"
+
+
+def export_onnx(model, path, input_size=160, opset=ONNX_OPSET):
+    """Exports the eager model to a single ONNX file with a dynamic batch axis."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    x = torch.randn(2, 3, input_size, input_size)
+    with torch.no_grad():
+        torch.onnx.export(model.cpu().eval(), x, str(tmp), input_names=['images'], output_names=['embeddings'],
+                          dynamic_axes={'images': {0: 'batch'}, 'embeddings': {0: 'batch'}},
+                          opset_version=opset, do_constant_folding=True)
+    # Some torch versions write weights to external .data files; pack them into one file
+    import onnx
+    onnx.save(onnx.load(str(tmp)), str(path))
+    for f in (tmp, tmp.with_name(tmp.name + '.data')):
+        f.unlink(missing_ok=True)
+    return path
+
+
+def export_torchscript(model, path, input_size=160):
+    """Traces and freezes the eager model; the batch size stays free at runtime."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    x = torch.randn(2, 3, input_size, input_size)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model.cpu().eval(), x))
+    tmp = path.with_name(path.name + '.tmp')
+    traced.save(str(tmp))
+    os.replace(tmp, path)
+    return path
+
+
+class OnnxEmbedder:
+    """
+    InceptionResnetV1 through onnxruntime on the CPU with all graph optimizations.
+    Called like the eager model: tensor in (any device), CPU float tensor out.
+    """
+    def __init__(self, path, threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+            options.inter_op_num_threads = 1
+        self.path = str(path)
+        self.session = onnxruntime.InferenceSession(self.path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        x = x.detach().cpu().numpy() if isinstance(x, torch.Tensor) else np.asarray(x)
+        out = self.session.run(None, {self.input_name: np.ascontiguousarray(x, dtype=np.float32)})[0]
+        return torch.from_numpy(out)
+
+    # Eager-model API used by callers
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+def load_exported_model(pretrained='vggface2', runtime='onnx', cache_dir=CACHE_DIR, input_size=160, threads=None,
+                        device='cpu'):
+    """
+    Loads the cached ONNX / TorchScript embedder, exporting it from the eager
+    model first if there is no cached artifact for this pretrained choice.
+    """
+    from src.recognition.face_recog_core import InceptionResnetV1
+
+    path = cached_model_path(pretrained, runtime, cache_dir, input_size)
+    if not path.exists():
+        print(f"[INFO] Exporting InceptionResnetV1 ({pretrained}) to {runtime}: {path}")
+        model = InceptionResnetV1(pretrained=pretrained).eval()
+        if runtime == 'onnx':
+            export_onnx(model, path, input_size)
+        else:
+            export_torchscript(model, path, input_size)
+    if runtime == 'onnx':
+        return OnnxEmbedder(path, threads=threads)
+    return torch.jit.load(str(path), map_location=device).eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export InceptionResnetV1 to the embedder cache")
+    parser.add_argument('--pretrained', type=str, default='vggface2', choices=['vggface2', 'casia-webface'])
+    parser.add_argument('--format', type=str, default='onnx', choices=['onnx', 'torchscript'])
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR)
+    parser.add_argument('--input_size', type=int, default=160)
+    parser.add_argument('--force', action='store_true', help="Re-export even if a cached model exists")
+    args = parser.parse_args()
+
+    path = cached_model_path(args.pretrained, args.format, args.cache_dir, args.input_size)
+    if args.force:
+        path.unlink(missing_ok=True)
+    load_exported_model(args.pretrained, args.format, args.cache_dir, args.input_size)
+    print(f"[INFO] Cached embedder: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# src/recognition/embedding_engine.py
+"""
+Batched face-embedding engine for the live pipeline.
+
+Crops are drained from a queue into dynamic micro-batches (bounded by
+max_batch and max_wait), preprocessed by face_recog_core.BGRPreprocessor
+into one pre-allocated buffer and embedded with one InceptionResnetV1
+forward pass.
+"""
+import threading
+
+import numpy as np
+import torch
+
+from src.pipeline.batching import collect_batch
+from src.recognition.face_recog_core import BGRPreprocessor
+
+
+class EmbeddingEngine:
+    def __init__(self, model, device, input_size=160, max_batch=32, max_wait=0.01):
+        self.model = model
+        self.device = torch.device(device)
+        self.input_size = input_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        # Re-used for every batch: no per-face allocations on the hot path
+        self.preprocessor = BGRPreprocessor(input_size, max_batch, self.device)
+        # Buffers are shared, so callers from different threads are serialised
+        self.lock = threading.Lock()
+
+    def collect(self, q, timeout=1.0):
+        """
+        Blocks up to `timeout` for the first item, then keeps draining `q` until
+        max_batch items are gathered or max_wait seconds have passed.
+        Returns a (possibly empty) list of queue items.
+        """
+        return collect_batch(q, self.max_batch, self.max_wait, timeout)
+
+    def preprocess(self, crops_bgr):
+        """
+        BGR uint8 crops (any size, or aligned S x S faces) -> normalised (n, 3, S, S) RGB tensor.
+        """
+        return self.preprocessor(crops_bgr)
+
+    def embed(self, crops_bgr):
+        """
+        Returns L2-normalised float32 embeddings (n, 512) for a list of BGR crops.
+        Lists longer than max_batch are processed in chunks.
+        """
+        outs = []
+        with self.lock:
+            for s in range(0, len(crops_bgr), self.max_batch):
+                x = self.preprocess(crops_bgr[s:s + self.max_batch])
+                with torch.no_grad():
+                    outs.append(self.model(x).cpu().numpy())
+        if not outs:
+            return np.zeros((0, 512), dtype=np.float32)
+        embs = np.concatenate(outs, axis=0)
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (embs / norms).astype(np.float32)
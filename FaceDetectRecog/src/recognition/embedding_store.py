@@ -0,0 +1,123 @@
+# src/recognition/embedding_store.py
+"""
+Packed reference embedding store.
+
+One contiguous (N, D) matrix saved as .npy (opened with np.memmap on load)
+plus a small JSON sidecar holding the ids and optional per-row metadata.
+A manifest names the current generation; it is replaced atomically after
+the new matrix and sidecar are fully written, so readers always see either
+the old or the new store, never a half-written one.
+
+Layout inside embeddings_dir:
+    store_manifest.json
+    embeddings_<gen>.npy
+    ids_<gen>.json
+"""
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_NAME = 'store_manifest.json'
+
+
+def _atomic_write_bytes(path, write_fn):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_manifest(embeddings_dir):
+    manifest = Path(embeddings_dir) / MANIFEST_NAME
+    if not manifest.exists():
+        return None
+    with open(manifest, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def has_store(embeddings_dir):
+    return read_manifest(embeddings_dir) is not None
+
+
+def write_store(embeddings_dir, embeddings, ids, meta=None, dtype='float32'):
+    """
+    Writes a new store generation and atomically swaps the manifest to it.
+
+    embeddings: (N, D) array, rows are L2-normalised before writing.
+    ids:        N ids (reference image file names).
+    meta:       optional list of N JSON-serialisable dicts.
+    dtype:      'float32' or 'float16'.
+    """
+    embeddings_dir = Path(embeddings_dir)
+    embeddings_dir.mkdir(parents=True, exist_ok=True)
+    ids = [str(i) for i in ids]
+    X = np.asarray(embeddings, dtype=np.float32)
+    X = X.reshape(len(ids), -1) if len(ids) else X.reshape(0, X.shape[-1] if X.ndim == 2 else 512)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    X = np.ascontiguousarray(X / norms, dtype=dtype)
+    if meta is not None and len(meta) != len(ids):
+        raise ValueError("meta must have one entry per id")
+
+    previous = read_manifest(embeddings_dir)
+    gen = previous['generation'] + 1 if previous else 1
+    matrix_name = f'embeddings_{gen}.npy'
+    ids_name = f'ids_{gen}.json'
+
+    _atomic_write_bytes(embeddings_dir / matrix_name, lambda f: np.save(f, X))
+    sidecar = json.dumps({'ids': ids, 'meta': meta}, separators=(',', ':')).encode('utf-8')
+    _atomic_write_bytes(embeddings_dir / ids_name, lambda f: f.write(sidecar))
+
+    manifest = {
+        'generation': gen,
+        'matrix': matrix_name,
+        'ids': ids_name,
+        'count': len(ids),
+        'dim': int(X.shape[1]) if X.ndim == 2 else 0,
+        'dtype': str(X.dtype),
+    }
+    _atomic_write_bytes(embeddings_dir / MANIFEST_NAME,
+                        lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')))
+
+    # Keep the previous generation for readers that are mid-load, drop older ones
+    keep = {matrix_name, ids_name}
+    if previous:
+        keep |= {previous['matrix'], previous['ids']}
+    for p in embeddings_dir.glob('embeddings_*.npy'):
+        if p.name not in keep:
+            _try_remove(p)
+    for p in embeddings_dir.glob('ids_*.json'):
+        if p.name not in keep:
+            _try_remove(p)
+    return embeddings_dir / MANIFEST_NAME
+
+
+def _try_remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # Still mapped by a reader (Windows); removed on a later write
+        pass
+
+
+def read_store(embeddings_dir, mmap=True):
+    """
+    Loads the current generation.
+
+    Returns:
+        (matrix, ids, meta) where matrix is a read-only np.memmap when mmap=True,
+        or None if the directory has no packed store.
+    """
+    embeddings_dir = Path(embeddings_dir)
+    manifest = read_manifest(embeddings_dir)
+    if manifest is None:
+        return None
+    matrix = np.load(str(embeddings_dir / manifest['matrix']), mmap_mode='r' if mmap else None)
+    with open(embeddings_dir / manifest['ids'], 'r', encoding='utf-8') as f:
+        sidecar = json.load(f)
+    return matrix, sidecar['ids'], sidecar.get('meta')
@@ -0,0 +1,109 @@
+# src/recognition/face_align.py
+"""
+Landmark-based face alignment for the recognition model.
+
+The five landmarks returned by FaceDetector.detect are mapped onto a
+canonical template with a similarity transform (rotation, uniform scale,
+translation), solved in closed form for all faces of a frame at once.
+Each face is then warped straight from the full frame into an aligned
+size x size BGR image with a single cv2.warpAffine, replacing the
+crop -> resize chain. Faces without landmarks fall back to a plain
+box-to-square transform, i.e. the old crop + resize.
+"""
+import cv2
+import numpy as np
+
+LANDMARK_KEYS = ('left_eye', 'right_eye', 'nose', 'left_mouth', 'right_mouth')
+
+# Canonical 5-point template for a 112x112 face (ArcFace layout)
+TEMPLATE_112 = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float64)
+
+
+def reference_points(size=160):
+    return TEMPLATE_112 * (size / 112.0)
+
+
+def landmarks_array(detections):
+    """
+    (N, 5, 2) float64 landmark array and (N,) bool mask of faces that have all five.
+    """
+    pts = np.zeros((len(detections), 5, 2), dtype=np.float64)
+    valid = np.zeros(len(detections), dtype=bool)
+    for i, det in enumerate(detections):
+        lm = det[5] if len(det) > 5 else None
+        if lm and all(k in lm for k in LANDMARK_KEYS):
+            pts[i] = [lm[k] for k in LANDMARK_KEYS]
+            valid[i] = True
+    return pts, valid
+
+
+def similarity_transforms(src, dst):
+    """
+    Least-squares similarity transforms mapping each src[i] (N, K, 2) onto dst (K, 2).
+    Returns (N, 2, 3) affine matrices for cv2.warpAffine.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0)
+    s = src - src_mean
+    d = dst - dst_mean
+    denom = np.maximum((s ** 2).sum(axis=(1, 2)), 1e-12)
+    # [x'; y'] = [a -b; b a] [x; y] + t
+    a = (s[..., 0] * d[None, :, 0] + s[..., 1] * d[None, :, 1]).sum(axis=1) / denom
+    b = (s[..., 0] * d[None, :, 1] - s[..., 1] * d[None, :, 0]).sum(axis=1) / denom
+    M = np.empty((len(src), 2, 3), dtype=np.float64)
+    M[:, 0, 0] = a
+    M[:, 0, 1] = -b
+    M[:, 1, 0] = b
+    M[:, 1, 1] = a
+    cx, cy = src_mean[:, 0, 0], src_mean[:, 0, 1]
+    M[:, 0, 2] = dst_mean[0] - (a * cx - b * cy)
+    M[:, 1, 2] = dst_mean[1] - (b * cx + a * cy)
+    return M
+
+
+def box_transforms(boxes, size=160):
+    """(N, 2, 3) affine matrices stretching each xyxy box onto a size x size square."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0)
+    h = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)
+    M = np.zeros((len(boxes), 2, 3), dtype=np.float64)
+    M[:, 0, 0] = size / w
+    M[:, 1, 1] = size / h
+    # Pixel-centre convention, matching cv2.resize of the crop
+    M[:, 0, 2] = (0.5 - boxes[:, 0]) * size / w - 0.5
+    M[:, 1, 2] = (0.5 - boxes[:, 1]) * size / h - 0.5
+    return M
+
+
+def alignment_transforms(detections, size=160):
+    """One (2, 3) transform per detection: landmark similarity, or box fallback."""
+    pts, valid = landmarks_array(detections)
+    M = box_transforms([d[:4] for d in detections], size)
+    if valid.any():
+        M[valid] = similarity_transforms(pts[valid], reference_points(size))
+    return M
+
+
+def align_faces(frame, detections, size=160, out=None):
+    """
+    Warps every detection (x1, y1, x2, y2, conf, landmarks) of one BGR frame
+    into an aligned (N, size, size, 3) uint8 array (written into out if given).
+    """
+    n = len(detections)
+    if out is None:
+        out = np.empty((n, size, size, 3), dtype=np.uint8)
+    if n == 0:
+        return out
+    for i, M in enumerate(alignment_transforms(detections, size)):
+        # Bilinear sampling straight from the full frame, no intermediate crop
+        cv2.warpAffine(frame, M, (size, size), dst=out[i], flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_REPLICATE)
+    return out
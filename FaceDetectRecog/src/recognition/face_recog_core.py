@@ -4,19 +4,28 @@ from pathlib import Path
 import csv
 import numpy as np
 import cv2
-from sklearn.metrics.pairwise import cosine_similarity
 
 import torch
 from facenet_pytorch import InceptionResnetV1
 from PIL import Image
 from torchvision import transforms
 
+from src.recognition.embedding_store import write_store, read_store
+
 
 def ensure_dirs():
     os.makedirs('models', exist_ok=True)
     os.makedirs('embeddings', exist_ok=True)
 
 
+# image loader -> BGR uint8 array (for BGRPreprocessor)
+def read_image_bgr(path):
+    img = cv2.imread(str(path))
+    if img is None:
+        raise ValueError(f"Failed to read image: {path}")
+    return img
+
+
 # image loader -> PIL
 def read_image(path):
     img = cv2.imread(str(path))
@@ -36,8 +45,76 @@ def make_transform(input_size=160):
     ])
 
 
-def load_model(device='cpu', pretrained='vggface2'):
+# preprocessing without PIL: BGR numpy in, normalised tensor out
+class BGRPreprocessor:
+    """
+    Same output as make_transform, straight from OpenCV BGR uint8 arrays.
+
+    Images (one HxWx3 array or a list) are resized with cv2 into a preallocated
+    uint8 staging tensor (pinned when the target is CUDA), then channel-swapped
+    to RGB, copied to the device and normalised to (x - 0.5) / 0.5 in place.
+    No PIL image, cvtColor copy or per-image tensor is created. The returned
+    (n, 3, S, S) tensor is a view of an internal buffer, valid until the next call.
+    """
+    def __init__(self, input_size=160, max_batch=32, device='cpu', pin_memory=None):
+        self.input_size = input_size
+        self.device = torch.device(device)
+        if pin_memory is None:
+            pin_memory = self.device.type == 'cuda' and torch.cuda.is_available()
+        self.pin_memory = pin_memory
+        self._allocate(max_batch)
+
+    def _allocate(self, max_batch):
+        S = self.input_size
+        self.max_batch = max_batch
+        self.staging = torch.empty((max_batch, S, S, 3), dtype=torch.uint8, pin_memory=self.pin_memory)
+        self.staging_np = self.staging.numpy()  # shares memory with the tensor
+        self.batch = torch.empty((max_batch, 3, S, S), dtype=torch.float32, device=self.device)
+
+    def __call__(self, images_bgr):
+        if isinstance(images_bgr, np.ndarray) and images_bgr.ndim == 3:
+            images_bgr = [images_bgr]
+        n = len(images_bgr)
+        if n > self.max_batch:
+            self._allocate(n)
+        S = self.input_size
+        for i, img in enumerate(images_bgr):
+            if img.shape[:2] == (S, S):
+                # Already aligned/resized: no resize needed
+                self.staging_np[i] = img
+                continue
+            interp = cv2.INTER_AREA if img.shape[0] > S or img.shape[1] > S else cv2.INTER_LINEAR
+            cv2.resize(img, (S, S), dst=self.staging_np[i], interpolation=interp)
+
+        # NHWC uint8 BGR -> NCHW float RGB in (x - 0.5) / 0.5 range
+        src = self.staging[:n].to(self.device, non_blocking=self.pin_memory)
+        out = self.batch[:n]
+        # One strided copy per channel is much faster than a permute+flip gather
+        for c in range(3):
+            out[:, c].copy_(src[..., 2 - c])
+        out.div_(127.5).sub_(1.0)
+        return out
+
+
+def load_model(device='cpu', pretrained='vggface2', runtime='eager', threads=None, quantize=None,
+               calib_dir='exported_images', calib_detector=None, calib_align=True, quant_state=None):
     # pretrained choices: 'vggface2' or 'casia-webface'
+    # runtime: 'eager', or 'onnx' / 'torchscript' (exported once and cached, see embedder_export;
+    # the onnx runtime always runs on the CPU)
+    # quantize: None, 'dynamic' or 'static' INT8 (eager runtime, CPU only; see quantize.py);
+    # static calibrates on the faces (found by calib_detector, aligned if calib_align) of the
+    # photos in calib_dir, a folder or a list of paths, and caches the result; quant_state
+    # loads such a cached result instead (worker processes)
+    if quantize:
+        if runtime != 'eager':
+            raise ValueError("quantize is only supported with the eager runtime")
+        from src.recognition.quantize import quantize_model
+        model = InceptionResnetV1(pretrained=pretrained).eval()
+        return quantize_model(model, quantize, calib_dir=calib_dir, detector=calib_detector,
+                              align=calib_align, pretrained=pretrained, state=quant_state)
+    if runtime != 'eager':
+        from src.recognition.embedder_export import load_exported_model
+        return load_exported_model(pretrained, runtime, threads=threads, device=device)
     model = InceptionResnetV1(pretrained=pretrained).eval().to(device)
     return model
 
@@ -55,48 +132,169 @@ def get_embedding_pytorch(img_pil, model, device, transform):
     return emb.astype(np.float32)
 
 
-def precompute_embeddings(dataset_dir, model, device, input_size=160, embeddings_dir='embeddings'):
+def get_embedding_bgr(images_bgr, model, device, preprocessor=None):
+    """
+    BGR uint8 image (or list of them) -> L2-normalised float32 embedding(s):
+    (512,) for a single image, (n, 512) for a list.
+    """
+    single = isinstance(images_bgr, np.ndarray) and images_bgr.ndim == 3
+    if preprocessor is None:
+        preprocessor = BGRPreprocessor(device=device)
+    x = preprocessor(images_bgr)
+    with torch.no_grad():
+        embs = model(x).cpu().numpy()
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embs = (embs / norms).astype(np.float32)
+    return embs[0] if single else embs
+
+
+def precompute_embeddings(dataset_dir, model, device, input_size=160, embeddings_dir='embeddings', dtype='float32'):
     dataset_dir = Path(dataset_dir)
     embeddings_dir = Path(embeddings_dir)
     embeddings_dir.mkdir(parents=True, exist_ok=True)
 
-    index_csv = embeddings_dir / 'embeddings_index.csv'
-    rows = []
+    ids = []
+    embs = []
 
-    transform = make_transform(input_size)
+    preprocessor = BGRPreprocessor(input_size=input_size, max_batch=1, device=device)
 
     image_paths = sorted([p for p in dataset_dir.iterdir() if p.is_file() and p.suffix.lower() in ['.jpg', '.jpeg', '.png']])
     print(f"Found {len(image_paths)} images in dataset_dir={dataset_dir}")
 
     for p in image_paths:
         try:
-            img = read_image(p)
-            emb = get_embedding_pytorch(img, model, device, transform)
+            img = read_image_bgr(p)
+            emb = get_embedding_bgr(img, model, device, preprocessor)
             if emb is None:
                 print(f"No embedding for {p}, skipping")
                 continue
-            emb_file = embeddings_dir / (p.stem + '.npy')
-            np.save(str(emb_file), emb)
-            rows.append([str(p.name), str(emb_file.name)])
-            print(f"Saved embedding for {p.name} -> {emb_file.name}")
+            ids.append(str(p.name))
+            embs.append(emb)
+            print(f"Embedded {p.name}")
         except Exception as e:
             print(f"Error processing {p}: {e}")
 
-    with open(index_csv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['image_file', 'embedding_file'])
-        writer.writerows(rows)
+    manifest = write_store(embeddings_dir, np.asarray(embs, dtype=np.float32), ids, dtype=dtype)
+    print(f"Precompute done. Packed store saved to {manifest}")
+    return manifest
+
+
+class ReferenceIndex:
+    """
+    In-memory reference store: a contiguous, L2-normalised float32 matrix (N, D)
+    plus a parallel array of ids (the reference image file names).
 
-    print(f"Precompute done. Index saved to {index_csv}")
-    return index_csv
+    Built once when the index is loaded so that every query is a single
+    matrix-vector (or matrix-matrix for a batch of queries) product.
+    """
+    def __init__(self, embeddings, ids, normalized=False):
+        # normalized=True: rows are already unit length (e.g. a memory-mapped
+        # packed store), so a float32 C-contiguous matrix is used without copying.
+        ids = list(ids)
+        X = np.asarray(embeddings)
+        X = X.reshape(len(ids), -1) if len(ids) else X.reshape(0, X.shape[-1] if X.ndim == 2 else 512)
+        if not (normalized and X.dtype == np.float32 and X.flags['C_CONTIGUOUS']):
+            X = X.astype(np.float32)
+            if not normalized:
+                norms = np.linalg.norm(X, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                X = X / norms
+            X = np.ascontiguousarray(X, dtype=np.float32)
+        self.matrix = X
+        self.ids = np.asarray(ids, dtype=object)
 
+    @classmethod
+    def from_items(cls, items):
+        # items: legacy list of {'image_file', 'embedding'} dicts
+        if len(items) == 0:
+            return cls(np.zeros((0, 512), dtype=np.float32), [])
+        return cls(np.stack([it['embedding'] for it in items], axis=0),
+                   [it['image_file'] for it in items])
 
-def load_embeddings_index(embeddings_dir='embeddings'):
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def _merged_rows(self, add_embeddings, add_ids, drop_ids):
+        keep = ~np.isin(self.ids, np.asarray(list(drop_ids), dtype=object))
+        add_ids = list(add_ids)
+        add = ReferenceIndex(np.asarray(add_embeddings, dtype=np.float32).reshape(len(add_ids), -1)
+                             if add_ids else np.zeros((0, self.dim), np.float32), add_ids)
+        matrix = np.concatenate([self.matrix[keep], add.matrix], axis=0)
+        ids = list(self.ids[keep]) + add_ids
+        return keep, matrix, ids, add.matrix
+
+    def merge(self, add_embeddings, add_ids, drop_ids=()):
+        """
+        Returns a new index with drop_ids removed and the new rows appended.
+        The existing rows are reused as-is, nothing is re-embedded.
+        """
+        _, matrix, ids, _ = self._merged_rows(add_embeddings, add_ids, drop_ids)
+        return ReferenceIndex(matrix, ids, normalized=True)
+
+    def similarities(self, queries):
+        # queries: (D,) or (M, D) -> cosine similarities (M, N)
+        Q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(Q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (Q / norms) @ self.matrix.T
+
+    def search(self, queries, topk=5):
+        """
+        Top-k cosine search for one query (D,) or a batch (M, D).
+
+        Returns:
+            (idxs, sims), both of shape (M, k), sorted by descending similarity.
+        """
+        sims = self.similarities(queries)
+        n = sims.shape[1]
+        k = min(topk, n)
+        if k <= 0:
+            empty = np.zeros((sims.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < n:
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n), (sims.shape[0], 1))
+        part_sims = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_sims, axis=1)
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_sims, order, axis=1)
+
+
+def load_embeddings_index(embeddings_dir='embeddings', backend='exact', nprobe=8, ef_search=64, rerank=64):
+    # backend: 'exact' (brute force), 'ivf' or 'faiss' (see ann_index.py).
+    # ANN indexes are persisted next to the embeddings and reused on reload.
     embeddings_dir = Path(embeddings_dir)
+    store = read_store(embeddings_dir, mmap=True)
+    if store is not None:
+        # Packed store: zero-copy memory map of the normalised matrix
+        matrix, ids, _ = store
+        normalized = True
+    else:
+        matrix, ids = _load_legacy_csv_index(embeddings_dir)
+        normalized = False
+    if len(ids) == 0:
+        raise RuntimeError("No embeddings loaded from index.")
+    if backend == 'exact':
+        return ReferenceIndex(matrix, ids, normalized=normalized)
+
+    from src.recognition.ann_index import build_ann_index
+    return build_ann_index(matrix, ids, backend=backend,
+                           cache_path=embeddings_dir / f'ann_{backend}.npz',
+                           nprobe=nprobe, ef_search=ef_search, rerank=rerank, normalized=normalized)
+
+
+def _load_legacy_csv_index(embeddings_dir):
+    # One .npy per image plus embeddings_index.csv (pre packed-store layout)
     index_csv = embeddings_dir / 'embeddings_index.csv'
     if not index_csv.exists():
-        raise FileNotFoundError(f"Embeddings index not found at {index_csv}. Run with --precompute first or place .npy files and a csv index there.")
-    items = []
+        raise FileNotFoundError(f"Embeddings index not found in {embeddings_dir}. Run with --precompute first.")
+    ids = []
+    embs = []
     with open(index_csv, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for r in reader:
@@ -106,29 +304,37 @@ def load_embeddings_index(embeddings_dir='embeddings'):
             if not emb_path.exists():
                 print(f"Warning: embedding file {emb_path} missing for image {img_file}, skipping")
                 continue
-            emb = np.load(str(emb_path))
-            n = np.linalg.norm(emb)
-            if n > 0:
-                emb = emb / n
-            items.append({'image_file': img_file, 'embedding': emb})
-    if len(items) == 0:
-        raise RuntimeError("No embeddings loaded from index.")
-    return items
+            embs.append(np.load(str(emb_path)).reshape(-1))
+            ids.append(img_file)
+    if len(ids) == 0:
+        return np.zeros((0, 512), dtype=np.float32), ids
+    return np.stack(embs, axis=0), ids
 
 
-def match_query(items, query_emb, topk=5, threshold=0.38):
-    X = np.stack([it['embedding'] for it in items], axis=0)
-    q = query_emb.reshape(1, -1)
-    sims = cosine_similarity(q, X).reshape(-1)
-    sims01 = (sims + 1.0) / 2.0
-    idxs = np.argsort(-sims)[:topk]
+def _matches_from_row(index, idxs, sims, threshold):
     matches = []
-    for i in idxs:
-        if float(sims[i]) >= threshold:
-            matches.append({'image_file': items[i]['image_file'], 'cosine': float(sims[i]), 'score01': float(sims01[i])})
+    for i, s in zip(idxs, sims):
+        if float(s) >= threshold:
+            matches.append({'image_file': index.ids[i], 'cosine': float(s), 'score01': (float(s) + 1.0) / 2.0})
     return matches
 
 
+def match_query(index, query_emb, topk=5, threshold=0.38):
+    # index: ReferenceIndex (a legacy list of item dicts is converted on the fly)
+    if not isinstance(index, ReferenceIndex):
+        index = ReferenceIndex.from_items(index)
+    idxs, sims = index.search(query_emb, topk=topk)
+    return _matches_from_row(index, idxs[0], sims[0], threshold)
+
+
+def match_queries(index, query_embs, topk=5, threshold=0.38):
+    # Batched match_query: query_embs (M, D) -> list of M match lists, one GEMM
+    if not isinstance(index, ReferenceIndex):
+        index = ReferenceIndex.from_items(index)
+    idxs, sims = index.search(query_embs, topk=topk)
+    return [_matches_from_row(index, i, s, threshold) for i, s in zip(idxs, sims)]
+
+
 def annotate_and_save(query_bgr, dataset_dir, matches, out_path='result_matches.jpg'):
     thumbs = []
     font = cv2.FONT_HERSHEY_SIMPLEX
@@ -0,0 +1,273 @@
+# src/recognition/quantize.py
+"""
+INT8 quantization of the InceptionResnetV1 embedder for CPU inference.
+
+    dynamic: linear layers (last_linear) get int8 weights, activations are
+             quantized on the fly. No calibration needed.
+    static:  post-training quantization with the fbgemm backend. Conv + BN + ReLU
+             blocks are fused and run in int8 with activation ranges observed on
+             the faces of a folder of reference photos (e.g. exported_images),
+             detected and cropped/aligned to input_size like live crops; the
+             linear layer stays dynamically quantized. FX graph mode handles the
+             residual adds/concats of the Inception blocks without model changes.
+             The quantized state_dict is cached in exported_models/, keyed on the
+             contents of the calibration photos, so restarts skip calibration;
+             worker processes load the parent's state file (state=) and never
+             calibrate on their own.
+
+verify_quantization() reports the embedding drift and top-1 match agreement
+of a quantized model against FP32 on a held-out set of images:
+
+    python -m src.recognition.quantize --mode static --images exported_images --holdout 0.3
+"""
+import argparse
+import copy
+import hashlib
+import os
+import random
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+QUANT_MODES = ('dynamic', 'static')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+CACHE_DIR = 'exported_models'
+
+
+def list_images(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS))
+
+
+def split_images(paths, holdout=0.3, seed=0):
+    """(calibration, held_out) split of image paths; the held-out part is never calibrated on."""
+    paths = list(paths)
+    random.Random(seed).shuffle(paths)
+    n_hold = int(round(len(paths) * holdout))
+    return paths[n_hold:], paths[:n_hold]
+
+
+def calibration_images(calib_dir, calib_limit=256):
+    """Calibration image paths of a folder (empty if it does not exist)."""
+    return list_images(calib_dir)[:calib_limit] if os.path.isdir(calib_dir) else []
+
+
+def load_images(paths):
+    """BGR images of paths; unreadable files (partial downloads, corrupt photos) are skipped."""
+    from src.recognition.face_recog_core import read_image_bgr
+    images = []
+    for p in paths:
+        try:
+            images.append(read_image_bgr(p))
+        except ValueError as e:
+            print(f"[WARN] {e}; skipped")
+    return images
+
+
+def face_crops(detector, images, align=True, input_size=160):
+    """
+    Most confident face of each BGR image, cropped like live faces: aligned to
+    input_size x input_size from the landmarks, or the clipped box when align is off.
+    Images without a face are skipped.
+    """
+    from src.tracking.feature_bank import clip_crop
+    from src.recognition.face_align import align_faces
+    crops = []
+    for img in images:
+        detections = detector.detect(img)
+        if len(detections) == 0:
+            continue
+        detections.sort(key=lambda x: x[4], reverse=True)
+        crop = clip_crop(img, detections[0])
+        if crop is None:
+            continue
+        if align:
+            crop = align_faces(img, detections[:1], input_size)[0]
+        crops.append(crop)
+    return crops
+
+
+def static_cache_path(paths, pretrained='vggface2', input_size=160, align=True, cache_dir=CACHE_DIR):
+    """
+    Cache file of the static INT8 state_dict calibrated on paths. The key covers the
+    image contents (not names or mtimes), so a re-download of the same photo keeps the
+    calibration and adding or changing a photo recalibrates.
+    """
+    digests = []
+    for p in paths:
+        with open(p, 'rb') as f:
+            digests.append(hashlib.sha1(f.read()).hexdigest())
+    h = hashlib.sha1(f"{pretrained}|{input_size}|{int(align)}|{torch.__version__}".encode())
+    for d in sorted(digests):
+        h.update(d.encode())
+    return Path(cache_dir) / f"inception_resnet_v1_{pretrained}_{input_size}_int8_static_{h.hexdigest()[:16]}.pt"
+
+
+def embed_images(model, images, batch=32, input_size=160):
+    """Raw (unnormalised) embeddings of BGR images, on the CPU."""
+    from src.recognition.face_recog_core import BGRPreprocessor
+    preprocessor = BGRPreprocessor(input_size, batch, 'cpu')
+    outs = []
+    with torch.no_grad():
+        for s in range(0, len(images), batch):
+            outs.append(model(preprocessor(images[s:s + batch])).cpu().numpy())
+    return np.concatenate(outs) if outs else np.zeros((0, 512), dtype=np.float32)
+
+
+def quantize_dynamic_model(model):
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).cpu().eval(), {nn.Linear},
+                                                  dtype=torch.qint8)
+
+
+def _prepare_static(model, input_size=160):
+    from torch.ao.quantization import QConfigMapping, default_dynamic_qconfig, get_default_qconfig
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    torch.backends.quantized.engine = 'fbgemm'
+    qconfig_mapping = (QConfigMapping()
+                       .set_global(get_default_qconfig('fbgemm'))
+                       .set_object_type(nn.Linear, default_dynamic_qconfig)
+                       .set_object_type(nn.BatchNorm1d, None))  # no quantized BatchNorm1d kernel
+    example = (torch.zeros(1, 3, input_size, input_size),)
+    return prepare_fx(copy.deepcopy(model).cpu().eval(), qconfig_mapping, example)
+
+
+def quantize_static_model(model, calib_images, batch=32, input_size=160):
+    """
+    Static PTQ (fbgemm) of convs + dynamic linear, calibrated on BGR face crops.
+    """
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    if not calib_images:
+        raise ValueError("Static quantization needs calibration images")
+    prepared = _prepare_static(model, input_size)
+    embed_images(prepared, calib_images, batch, input_size)  # observers record activation ranges
+    return convert_fx(prepared)
+
+
+def load_static_model(model, path, input_size=160):
+    """Static INT8 model with the cached state_dict of an earlier calibration."""
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    with warnings.catch_warnings():
+        # The uncalibrated observers only shape the graph; the cache holds the real qparams
+        warnings.filterwarnings('ignore', message='must run observer')
+        quant = convert_fx(_prepare_static(model, input_size))
+    quant.load_state_dict(torch.load(path, map_location='cpu', weights_only=False))
+    return quant
+
+
+def quantize_model(model, mode, calib_dir='exported_images', calib_limit=256, batch=32, input_size=160,
+                   detector=None, align=True, pretrained='vggface2', cache_dir=CACHE_DIR, state=None):
+    """
+    calib_dir: folder of reference photos, or a list of their paths; None never calibrates.
+    detector: FaceDetector used to crop the calibration faces; built on a cache miss if None.
+    state: static state_dict file of an earlier calibration (see static_cache_path), loaded
+    as is. With calib_dir=None and no state (the parent fell back), dynamic is used.
+    """
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode == 'dynamic':
+        return quantize_dynamic_model(model)
+    if state is not None:
+        print(f"[INFO] Loaded static INT8 embedder from {state}")
+        return load_static_model(model, state, input_size)
+    if calib_dir is None:
+        return quantize_dynamic_model(model)
+    paths = calibration_images(calib_dir, calib_limit) if isinstance(calib_dir, (str, Path)) else list(calib_dir)
+    paths = [p for p in paths if os.path.isfile(p)]
+    if not paths:
+        # e.g. first start, before the reference DB has downloaded any photos
+        print(f"[WARN] No calibration images in {calib_dir}; using dynamic quantization")
+        return quantize_dynamic_model(model)
+
+    cache_path = static_cache_path(paths, pretrained, input_size, align, cache_dir)
+    if cache_path.exists():
+        try:
+            quant = load_static_model(model, cache_path, input_size)
+            print(f"[INFO] Loaded static INT8 embedder from {cache_path}")
+            return quant
+        except (RuntimeError, OSError) as e:
+            print(f"[WARN] Cached INT8 embedder {cache_path} unusable ({e}); recalibrating")
+
+    if detector is None:
+        from src.detection.face2 import FaceDetector
+        detector = FaceDetector()
+    crops = face_crops(detector, load_images(paths), align, input_size)
+    if not crops:
+        print(f"[WARN] No faces in the calibration images of {calib_dir}; using dynamic quantization")
+        return quantize_dynamic_model(model)
+    print(f"[INFO] Calibrating static INT8 embedder on {len(crops)} faces from {len(paths)} images")
+    quant = quantize_static_model(model, crops, batch, input_size)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix('.tmp')
+    torch.save(quant.state_dict(), tmp)
+    os.replace(tmp, cache_path)  # atomic: a worker never reads a half-written file
+    return quant
+
+
+def _l2n(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def verify_quantization(fp32_model, quant_model, images, batch=32, input_size=160):
+    """
+    Compares quantized vs FP32 embeddings of held-out BGR images.
+    drift: 1 - cosine(fp32, int8) per image. top1_agreement: fraction of images whose
+    nearest other held-out image (leave-one-out) is the same under both models.
+    """
+    a = _l2n(embed_images(fp32_model, images, batch, input_size))
+    b = _l2n(embed_images(quant_model, images, batch, input_size))
+    drift = 1.0 - (a * b).sum(axis=1)
+    report = {
+        'n': len(images),
+        'mean_drift': float(drift.mean()) if len(drift) else float('nan'),
+        'max_drift': float(drift.max()) if len(drift) else float('nan'),
+        'top1_agreement': float('nan'),
+    }
+    if len(images) > 1:
+        sa, sb = a @ a.T, b @ b.T
+        np.fill_diagonal(sa, -np.inf)
+        np.fill_diagonal(sb, -np.inf)
+        report['top1_agreement'] = float((sa.argmax(axis=1) == sb.argmax(axis=1)).mean())
+    return report
+
+
+def main():
+    from src.detection.face2 import FaceDetector
+    from src.recognition.face_recog_core import load_model
+
+    parser = argparse.ArgumentParser(description="Quantize the embedder and verify it against FP32")
+    parser.add_argument('--mode', type=str, default='static', choices=QUANT_MODES)
+    parser.add_argument('--images', type=str, default='exported_images', help='Folder of reference photos')
+    parser.add_argument('--holdout', type=float, default=0.3, help='Fraction of images kept out of calibration')
+    parser.add_argument('--calib_limit', type=int, default=256)
+    parser.add_argument('--pretrained', type=str, default='vggface2')
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--detector', type=str, default='yolov8n-face.pt', help='Face detector weights')
+    parser.add_argument('--no-align', action='store_true', help='Box crops instead of aligned faces')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    calib, held_out = split_images(list_images(args.images), args.holdout)
+    detector = FaceDetector(args.detector)
+    align = not args.no_align
+    fp32 = load_model(device='cpu', pretrained=args.pretrained)
+    calib_faces = face_crops(detector, load_images(calib[:args.calib_limit]), align)
+    if args.mode == 'static':
+        quant = quantize_static_model(fp32, calib_faces, args.batch)
+    else:
+        quant = quantize_dynamic_model(fp32)
+
+    report = verify_quantization(fp32, quant, face_crops(detector, load_images(held_out), align), args.batch)
+    print(f"mode={args.mode} calibration={len(calib_faces)} held_out={report['n']}")
+    print(f"embedding drift (1 - cos): mean {report['mean_drift']:.5f}  max {report['max_drift']:.5f}")
+    print(f"top-1 match agreement with FP32: {report['top1_agreement']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# src/tracking/deep_sort.py
+"""
+Lightweight SORT-style face tracker (IoU association + constant-velocity Kalman filter).
+
+All live tracks are kept as stacked arrays, so prediction, IoU association and
+the Kalman update run as batched NumPy operations instead of a Python loop per
+track. The API matches what src/detection/test1_dt.py expects:
+
+    tracker = Tracker(max_age=30, n_init=3, max_iou_distance=0.7)
+    tracks = tracker.update([(x1, y1, x2, y2, conf), ...], frame)
+    # -> [{'track_id', 'bbox', 'confidence', 'det_index'}, ...] for confirmed tracks
+"""
+import itertools
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+# State: [cx, cy, s (area), r (aspect w/h), vcx, vcy, vs]; measurement: [cx, cy, s, r]
+_F = np.eye(7, dtype=np.float64)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7, dtype=np.float64)
+_Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 1e-4]).astype(np.float64)
+_R = np.diag([1, 1, 10, 10]).astype(np.float64)
+_P0 = np.diag([10, 10, 10, 10, 1e4, 1e4, 1e4]).astype(np.float64)
+
+
+def xyxy_to_z(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)], axis=1)
+
+
+def x_to_xyxy(x):
+    s = np.maximum(x[:, 2], 1e-6)
+    r = np.maximum(x[:, 3], 1e-6)
+    w = np.sqrt(s * r)
+    h = s / np.maximum(w, 1e-6)
+    return np.stack([x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2], axis=1)
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _assign(cost, max_cost):
+    if cost.size == 0:
+        return []
+    if SCIPY_AVAILABLE:
+        rows, cols = linear_sum_assignment(cost)
+        pairs = zip(rows, cols)
+    else:
+        # Greedy fallback: cheapest pairs first
+        order = np.dstack(np.unravel_index(np.argsort(cost, axis=None), cost.shape))[0]
+        used_r, used_c, pairs = set(), set(), []
+        for r, c in order:
+            if r not in used_r and c not in used_c:
+                used_r.add(r)
+                used_c.add(c)
+                pairs.append((r, c))
+    return [(int(r), int(c)) for r, c in pairs if cost[r, c] <= max_cost]
+
+
+class Track:
+    """Per-track bookkeeping; the Kalman state lives in the Tracker's arrays."""
+    def __init__(self, track_id, confidence):
+        self.track_id = track_id
+        self.confidence = confidence
+        self.hits = 1
+        self.age = 0
+        self.time_since_update = 0
+        self.confirmed = False
+        self.det_index = None  # detection matched in the latest update (None if coasting)
+        # Embedding schedule (see embedding_due)
+        self.last_embed_time = None
+        self.embed_quality = 0.0
+
+    def embedding_due(self, now, quality, refresh_interval, quality_gain):
+        """
+        True if this track should be (re-)embedded: never embedded yet, the
+        current detection is clearly better than the embedded one, or the
+        last embedding is older than refresh_interval seconds.
+        """
+        if self.last_embed_time is None:
+            return True
+        if quality > self.embed_quality * (1.0 + quality_gain):
+            return True
+        return refresh_interval is not None and now - self.last_embed_time >= refresh_interval
+
+    def mark_embedded(self, now, quality):
+        self.last_embed_time = now
+        self.embed_quality = quality
+
+
+class Tracker:
+    def __init__(self, max_age=30, n_init=3, max_iou_distance=0.7):
+        self.max_age = max_age
+        self.n_init = n_init
+        self.max_iou_distance = max_iou_distance
+        self.tracks = []
+        self.means = np.zeros((0, 7), dtype=np.float64)
+        self.covs = np.zeros((0, 7, 7), dtype=np.float64)
+        self._ids = itertools.count(1)
+
+    def predict(self):
+        if not self.tracks:
+            return
+        # Keep the predicted area positive
+        bad = self.means[:, 2] + self.means[:, 6] <= 0
+        self.means[bad, 6] = 0.0
+        self.means = self.means @ _F.T
+        self.covs = _F @ self.covs @ _F.T + _Q
+        for t in self.tracks:
+            t.age += 1
+            t.time_since_update += 1
+            t.det_index = None
+
+    def _kalman_update(self, idx, z):
+        P = self.covs[idx]
+        S = _H @ P @ _H.T + _R
+        K = P @ _H.T @ np.linalg.inv(S)
+        y = z - self.means[idx] @ _H.T
+        self.means[idx] = self.means[idx] + np.einsum('nij,nj->ni', K, y)
+        self.covs[idx] = (np.eye(7) - K @ _H) @ P
+
+    def update(self, detections, frame=None):
+        """
+        detections: iterable of (x1, y1, x2, y2, conf), or an (N, >=5) array
+        such as FaceDetector.detect_batch(..., return_arrays=True) returns.
+        frame is accepted for API compatibility (appearance features are not used).
+        Returns confirmed tracks that were matched in this update.
+        """
+        if isinstance(detections, np.ndarray):
+            dets = np.asarray(detections[:, :5], dtype=np.float64).reshape(-1, 5)
+        else:
+            dets = np.asarray([d[:5] for d in detections], dtype=np.float64).reshape(-1, 5)
+        self.predict()
+
+        matches = []
+        if self.tracks and len(dets):
+            cost = 1.0 - iou_matrix(x_to_xyxy(self.means), dets[:, :4])
+            matches = _assign(cost, self.max_iou_distance)
+
+        matched_t = np.array([t for t, _ in matches], dtype=np.int64)
+        matched_d = np.array([d for _, d in matches], dtype=np.int64)
+        if len(matches):
+            self._kalman_update(matched_t, xyxy_to_z(dets[matched_d, :4]))
+            for ti, di in matches:
+                t = self.tracks[ti]
+                t.hits += 1
+                t.time_since_update = 0
+                t.confidence = float(dets[di, 4])
+                t.det_index = di
+                if t.hits >= self.n_init:
+                    t.confirmed = True
+
+        # New tracks for unmatched detections
+        unmatched = np.setdiff1d(np.arange(len(dets)), matched_d)
+        if len(unmatched):
+            z = xyxy_to_z(dets[unmatched, :4])
+            new_means = np.concatenate([z, np.zeros((len(z), 3))], axis=1)
+            self.means = np.concatenate([self.means, new_means], axis=0)
+            self.covs = np.concatenate([self.covs, np.repeat(_P0[None], len(z), axis=0)], axis=0)
+            for di in unmatched:
+                t = Track(next(self._ids), float(dets[di, 4]))
+                t.det_index = int(di)
+                t.confirmed = self.n_init <= 1
+                self.tracks.append(t)
+
+        # Drop tracks that coasted too long, and tentative tracks that missed once
+        keep = np.array([t.time_since_update <= self.max_age and (t.confirmed or t.time_since_update == 0)
+                         for t in self.tracks], dtype=bool)
+        if not keep.all():
+            self.tracks = [t for t, k in zip(self.tracks, keep) if k]
+            self.means = self.means[keep]
+            self.covs = self.covs[keep]
+
+        return self.confirmed_tracks()
+
+    def confirmed_tracks(self):
+        if not self.tracks:
+            return []
+        boxes = x_to_xyxy(self.means)
+        out = []
+        for t, box in zip(self.tracks, boxes):
+            if t.confirmed and t.time_since_update == 0:
+                out.append({
+                    'track_id': t.track_id,
+                    'bbox': tuple(int(v) for v in box),
+                    'confidence': t.confidence,
+                    'det_index': t.det_index,
+                    'track': t,
+                })
+        return out
+
+
+def detection_quality(det):
+    """Crude face quality for scheduling embeddings: box area weighted by confidence."""
+    x1, y1, x2, y2, conf = det[:5]
+    return max(0, x2 - x1) * max(0, y2 - y1) * float(conf)
+
+
+def select_for_embedding(tracks, detections, now, refresh_interval=10.0, quality_gain=0.25, qualities=None):
+    """
+    Given update()'s output and the detections it was fed, returns
+    [(det_index, track_id), ...] for the tracks that need an embedding now
+    (entry, quality improvement or refresh) and marks them as embedded.
+    qualities: optional per-detection scores (e.g. feature_bank.face_quality);
+    defaults to detection_quality.
+    """
+    selected = []
+    for tr in tracks:
+        di = tr['det_index']
+        if di is None:
+            continue
+        quality = qualities[di] if qualities is not None else detection_quality(detections[di])
+        track = tr['track']
+        if track.embedding_due(now, quality, refresh_interval, quality_gain):
+            track.mark_embedded(now, quality)
+            selected.append((di, tr['track_id']))
+    return selected
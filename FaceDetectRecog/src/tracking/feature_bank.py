@@ -0,0 +1,135 @@
+# src/tracking/feature_bank.py
+"""
+Per-track face quality scoring and embedding aggregation.
+
+Each track keeps its top-K crops by quality. Recognition then runs once per
+improvement of that bank, on the quality-weighted mean embedding (or on the
+single best shot) instead of on every crop independently.
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+def clip_crop(frame, det):
+    """Crop of detection det clipped to the frame, or None if the box is empty."""
+    h, w = frame.shape[:2]
+    x1, y1 = max(0, det[0]), max(0, det[1])
+    x2, y2 = min(w, det[2]), min(h, det[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return frame[y1:y2, x1:x2]
+
+
+def frontalness(landmarks):
+    """
+    0..1 from the five landmarks of FaceDetector.detect: 1 when the nose sits
+    midway between the eyes and the eyes are level, lower for profile/tilted faces.
+    Returns 0.5 (unknown) when landmarks are missing.
+    """
+    if not landmarks or 'left_eye' not in landmarks:
+        return 0.5
+    le = np.asarray(landmarks['left_eye'], dtype=np.float32)
+    re = np.asarray(landmarks['right_eye'], dtype=np.float32)
+    nose = np.asarray(landmarks['nose'], dtype=np.float32)
+    eye_dist = float(np.linalg.norm(re - le))
+    if eye_dist < 1:
+        return 0.0
+    mid = (le + re) / 2
+    # Horizontal nose offset from the eye midpoint (yaw), and eye-line slope (roll)
+    yaw = abs(float(nose[0] - mid[0])) / eye_dist
+    roll = abs(float(re[1] - le[1])) / eye_dist
+    return float(np.clip(1.0 - 2.0 * yaw - roll, 0.0, 1.0))
+
+
+def sharpness(crop, size=64):
+    """Laplacian variance of a downscaled grayscale crop, squashed to 0..1."""
+    if crop is None or crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    gray = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    var = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    return var / (var + 100.0)
+
+
+def face_quality(det, crop, min_size=40, good_size=112):
+    """
+    Combined 0..1 quality of one detection (x1, y1, x2, y2, conf, landmarks):
+    face size, detector confidence, blur and frontalness, multiplied so any
+    single bad factor pulls the score down.
+    """
+    x1, y1, x2, y2, conf = det[:5]
+    landmarks = det[5] if len(det) > 5 else None
+    side = min(x2 - x1, y2 - y1)
+    size = float(np.clip((side - min_size) / (good_size - min_size), 0.0, 1.0))
+    size = 0.2 + 0.8 * size
+    return size * float(conf) * (0.2 + 0.8 * sharpness(crop)) * (0.3 + 0.7 * frontalness(landmarks))
+
+
+class TrackBank:
+    def __init__(self):
+        self.entries = []  # (quality, emb, crop, frame_id), best first
+        self.last_seen = 0.0
+
+
+class TrackFeatureBank:
+    """
+    Top-K embeddings per track key (e.g. (camera_id, track_id)).
+
+    add() returns True when the track's query embedding changed and recognition is worth re-running.
+    mode 'mean' queries the quality-weighted mean, 'best' the best shot.
+    """
+    def __init__(self, top_k=5, mode='mean', ttl=60.0):
+        if mode not in ('mean', 'best'):
+            raise ValueError(f"Unknown aggregation mode: {mode}")
+        self.top_k = top_k
+        self.mode = mode
+        self.ttl = ttl
+        self.banks = {}
+
+    def __len__(self):
+        return len(self.banks)
+
+    def add(self, key, emb, quality, crop=None, frame_id=None):
+        bank = self.banks.setdefault(key, TrackBank())
+        bank.last_seen = time.monotonic()
+        entries = bank.entries
+        if len(entries) >= self.top_k and quality <= entries[-1][0]:
+            return False
+        # Copy the crop so a view does not keep the whole frame alive
+        crop = None if crop is None else crop.copy()
+        entry = (float(quality), np.asarray(emb, dtype=np.float32), crop, frame_id)
+        entries.append(entry)
+        entries.sort(key=lambda e: e[0], reverse=True)
+        del entries[self.top_k:]
+        # In 'best' mode the query only changes when the new crop is the best shot
+        return self.mode == 'mean' or entries[0] is entry
+
+    def query_embedding(self, key):
+        """L2-normalised aggregate embedding for key, or None."""
+        bank = self.banks.get(key)
+        if bank is None or not bank.entries:
+            return None
+        if self.mode == 'best':
+            emb = bank.entries[0][1]
+        else:
+            q = np.array([e[0] for e in bank.entries], dtype=np.float32)
+            embs = np.stack([e[1] for e in bank.entries])
+            emb = (q / max(float(q.sum()), 1e-6)) @ embs
+        return emb / max(float(np.linalg.norm(emb)), 1e-12)
+
+    def best_shot(self, key):
+        """(quality, emb, crop, frame_id) of the best entry, or None."""
+        bank = self.banks.get(key)
+        if bank is None or not bank.entries:
+            return None
+        return bank.entries[0]
+
+    def expire(self, now=None):
+        """Drops banks of tracks not seen for ttl seconds; returns how many."""
+        now = time.monotonic() if now is None else now
+        stale = [k for k, b in self.banks.items() if now - b.last_seen > self.ttl]
+        for k in stale:
+            del self.banks[k]
+        return len(stale)
@@ -0,0 +1,75 @@
+import os
+
+os.environ.setdefault("YOLO_OFFLINE", "1")
+os.environ.setdefault("YOLO_AUTOINSTALL", "false")  # never pip-install exporter deps from a test
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+PoseModel = pytest.importorskip("ultralytics.nn.tasks").PoseModel
+
+from src.detection.detector_export import cached_export_path
+from src.detection.face2 import FaceDetector
+
+
+@pytest.fixture(scope="module")
+def face_weights(tmp_path_factory):
+    # Random-weight YOLOv8n pose model with yolov8-face's 5 landmarks (no download needed)
+    torch.manual_seed(0)
+    model = PoseModel("yolov8n-pose.yaml", nc=1, data_kpt_shape=(5, 3), verbose=False)
+    model.args = {"task": "pose", "imgsz": 320}
+    model.names = {0: "face"}
+    path = tmp_path_factory.mktemp("weights") / "face_rand.pt"
+    torch.save({"model": model.half(), "train_args": {"task": "pose"}}, path)
+    return path
+
+
+def test_onnx_backend_loads_exported_model(face_weights):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(2)]
+
+    ref = FaceDetector(str(face_weights), conf_thresh=0.0, device="cpu", imgsz=320)
+    det = FaceDetector(str(face_weights), conf_thresh=0.0, device="cpu", imgsz=320, backend="onnx", cpu_threads=1)
+    assert det.backend == "onnx"
+    assert cached_export_path(face_weights, "onnx", imgsz=320).exists()
+    # cpu_threads reaches the session that actually runs
+    backend = getattr(det.predictor.model, "backend", det.predictor.model)
+    session = backend.session
+    assert session.get_session_options().intra_op_num_threads == 1
+
+    # The exported network matches PyTorch on the same (dynamic-shape) batch
+    import onnxruntime
+    x = torch.rand(2, 3, 256, 320)
+    with torch.no_grad():
+        expected = ref.model.model.float().eval()(x)[0].numpy()
+    session = onnxruntime.InferenceSession(str(cached_export_path(face_weights, "onnx", imgsz=320)))
+    actual = session.run(None, {session.get_inputs()[0].name: x.numpy()})[0]
+    np.testing.assert_allclose(actual, expected, atol=1e-3, rtol=1e-3)
+
+    # and FaceDetector's onnx path returns boxes with landmarks
+    arrays = det._extract_arrays(det.runtime(frames, imgsz=320, conf=0.0, verbose=False, device="cpu"))
+    for a in arrays:
+        assert a.ndim == 2 and a.shape[1] == 15 and len(a)
+        assert not np.isnan(a[:, 5:]).any()
+
+    # A second detector reuses the cached artifact
+    again = FaceDetector(str(face_weights), conf_thresh=0.0, device="cpu", imgsz=320, backend="onnx")
+    assert again.backend == "onnx"
+    assert len(again.detect_batch(frames)) == 2
+
+
+def test_reused_predictor_matches_yolo_call(face_weights):
+    rng = np.random.default_rng(1)
+    frames = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(2)]
+    det = FaceDetector(str(face_weights), conf_thresh=0.0, device="cpu", imgsz=320)
+
+    # detect_batch skips YOLO.__call__ but keeps its preprocessing, NMS and keypoints
+    expected = det._extract_arrays(det.model(frames, imgsz=320, conf=0.0, verbose=False, device="cpu"))
+    _, actual = det.detect_batch(frames, return_arrays=True)
+    for a, e in zip(actual, expected):
+        np.testing.assert_allclose(a, e, atol=1e-4)
+        assert len(a) and not np.isnan(a[:, 5:]).any()
+    assert det.detect(frames[0]) == det.to_tuples(actual[0])
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("facenet_pytorch")
+
+from src.recognition.bench_embedder import l2n, run
+from src.recognition.embedder_export import OnnxEmbedder, export_onnx, export_torchscript
+from src.recognition.face_recog_core import InceptionResnetV1
+
+
+@pytest.fixture(scope="module")
+def eager():
+    # Random weights (bench_embedder --pretrained none): no download needed
+    torch.manual_seed(0)
+    return InceptionResnetV1(pretrained=None).eval()
+
+
+@pytest.fixture(scope="module")
+def faces():
+    return torch.from_numpy(np.random.default_rng(0).uniform(-1, 1, (8, 3, 160, 160)).astype(np.float32))
+
+
+def load_onnx(eager, path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    return OnnxEmbedder(export_onnx(eager, path.with_suffix(".onnx")), threads=1)
+
+
+def load_torchscript(eager, path):
+    return torch.jit.load(str(export_torchscript(eager, path.with_suffix(".torchscript.pt"))))
+
+
+@pytest.mark.parametrize("load", [load_onnx, load_torchscript], ids=["onnx", "torchscript"])
+def test_exported_embedder_matches_eager(eager, faces, tmp_path, load):
+    exported = load(eager, tmp_path / "m")
+    ref = l2n(run(eager, faces, batch=4))
+    cos = (l2n(run(exported, faces, batch=4)) * ref).sum(axis=1)
+    assert cos.min() >= 0.999